@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import abc
+import math
+import bisect
+import random
+import struct
+import hashlib
+
+__author__ = 'tong'
+
+
+class Aggregator(object):
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def __call__(self, items):
+        state = self.initial()
+        for item in items:
+            state = self.add(state, item)
+        return self.result(state)
+
+    def initial(self):
+        return None
+
+    def add(self, state, item):
+        return self.update(state, self.value(item) if self.value else item)
+
+    @abc.abstractmethod
+    def update(self, state, value):
+        pass
+
+    @abc.abstractmethod
+    def merge(self, state, other):
+        pass
+
+    def result(self, state):
+        return state
+
+
+class Count(Aggregator):
+    def initial(self):
+        return 0
+
+    def add(self, state, item):
+        return state + 1
+
+    def update(self, state, value):
+        return state + 1
+
+    def merge(self, state, other):
+        return state + other
+
+
+class Sum(Aggregator):
+    def initial(self):
+        return 0
+
+    def update(self, state, value):
+        return state + value
+
+    def merge(self, state, other):
+        return state + other
+
+
+class Min(Aggregator):
+    def update(self, state, value):
+        if state is None or value < state:
+            return value
+        return state
+
+    def merge(self, state, other):
+        if other is None:
+            return state
+        return self.update(state, other)
+
+
+class Max(Aggregator):
+    def update(self, state, value):
+        if state is None or value > state:
+            return value
+        return state
+
+    def merge(self, state, other):
+        if other is None:
+            return state
+        return self.update(state, other)
+
+
+class Mean(Aggregator):
+    def initial(self):
+        return 0, 0
+
+    def update(self, state, value):
+        return state[0] + 1, state[1] + value
+
+    def merge(self, state, other):
+        return state[0] + other[0], state[1] + other[1]
+
+    def result(self, state):
+        if not state[0]:
+            return None
+        return float(state[1]) / state[0]
+
+
+class Variance(Aggregator):
+    def __init__(self, value=None, ddof=0):
+        super(Variance, self).__init__(value)
+        self.ddof = ddof
+
+    def initial(self):
+        return 0, 0.0, 0.0
+
+    def update(self, state, value):
+        count, mean, m2 = state
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        return count, mean, m2 + delta * (value - mean)
+
+    def merge(self, state, other):
+        if not other[0]:
+            return state
+        if not state[0]:
+            return other
+        count = state[0] + other[0]
+        delta = other[1] - state[1]
+        mean = state[1] + delta * other[0] / count
+        return count, mean, state[2] + other[2] + delta * delta * state[0] * other[0] / count
+
+    def result(self, state):
+        if state[0] <= self.ddof:
+            return None
+        return state[2] / (state[0] - self.ddof)
+
+
+class HyperLogLog(Aggregator):
+    def __init__(self, value=None, precision=14, sparse=None):
+        super(HyperLogLog, self).__init__(value)
+        if not 4 <= precision <= 16:
+            raise Exception('HyperLogLog precision should be in [4, 16]')
+        self.precision = precision
+        self.size = 1 << precision
+        self.mask = (1 << (64 - precision)) - 1
+        self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(self.size, 0.7213 / (1 + 1.079 / self.size))
+        self.sparse = self.size >> 7 if sparse is None else sparse
+
+    def initial(self):
+        return {} if self.sparse else bytearray(self.size)
+
+    def dense(self, state):
+        if not isinstance(state, dict):
+            return bytearray(state)
+        registers = bytearray(self.size)
+        for index, rank in state.iteritems():
+            registers[index] = rank
+        return registers
+
+    def update(self, state, value):
+        if isinstance(value, unicode):
+            value = value.encode('utf-8')
+        elif not isinstance(value, str):
+            value = repr(value)
+        code = struct.unpack('<Q', hashlib.md5(value).digest()[:8])[0]
+        index = code >> (64 - self.precision)
+        rank = 64 - self.precision - (code & self.mask).bit_length() + 1
+        if isinstance(state, dict):
+            if state.get(index, 0) < rank:
+                state[index] = rank
+                if len(state) > self.sparse:
+                    return self.dense(state)
+            return state
+        if state[index] < rank:
+            state[index] = rank
+        return state
+
+    def merge(self, state, other):
+        if isinstance(state, dict) and isinstance(other, dict):
+            state = dict(state)
+            for index, rank in other.iteritems():
+                if state.get(index, 0) < rank:
+                    state[index] = rank
+            return self.dense(state) if len(state) > self.sparse else state
+        state = self.dense(state)
+        items = other.iteritems() if isinstance(other, dict) else enumerate(bytearray(other))
+        for index, rank in items:
+            if state[index] < rank:
+                state[index] = rank
+        return state
+
+    def result(self, state):
+        if isinstance(state, dict):
+            zeros = self.size - len(state)
+            total = zeros + sum([2.0 ** -_ for _ in state.itervalues()])
+        else:
+            state = bytearray(state)
+            zeros = state.count('\x00')
+            total = sum([2.0 ** -_ for _ in state])
+        estimate = self.alpha * self.size * self.size / total
+        if zeros and estimate <= 2.5 * self.size:
+            return int(round(self.size * math.log(float(self.size) / zeros)))
+        return int(round(estimate))
+
+
+class Quantile(Aggregator):
+    def __init__(self, quantiles=0.5, value=None, k=200, c=2.0 / 3.0):
+        super(Quantile, self).__init__(value)
+        self.quantiles = quantiles
+        self.k = k
+        self.c = c
+
+    def initial(self):
+        return [[]]
+
+    def capacity(self, height, depth):
+        return int(math.ceil(self.k * self.c ** (depth - height - 1))) + 1
+
+    def update(self, state, value):
+        state[0].append(value)
+        if len(state[0]) >= self.capacity(0, len(state)):
+            self.compress(state)
+        return state
+
+    def compress(self, state):
+        height = 0
+        while height < len(state):
+            items = state[height]
+            if len(items) >= self.capacity(height, len(state)):
+                if height + 1 == len(state):
+                    state.append([])
+                items.sort()
+                offset = random.random() < 0.5
+                state[height + 1].extend(items[offset:len(items) - len(items) % 2:2])
+                state[height] = items[-1:] if len(items) % 2 else []
+            height += 1
+
+    def merge(self, state, other):
+        state = [list(_) for _ in state]
+        for height, items in enumerate(other):
+            if height == len(state):
+                state.append([])
+            state[height].extend(items)
+        self.compress(state)
+        return state
+
+    def result(self, state):
+        items = sorted([(item, 1 << height) for height, items in enumerate(state) for item in items])
+        if not items:
+            return None
+        weights = []
+        total = 0
+        for _, weight in items:
+            total += weight
+            weights.append(total)
+        quantiles = self.quantiles if isinstance(self.quantiles, (list, tuple)) else [self.quantiles]
+        results = [items[min(bisect.bisect_left(weights, q * total), len(items) - 1)][0] for q in quantiles]
+        return results if isinstance(self.quantiles, (list, tuple)) else results[0]
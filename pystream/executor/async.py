@@ -1,8 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
+import sys
+import time
+import heapq
+import errno
+import ctypes
+import select
+import socket
 import logging
-from asyncore import dispatcher
+import ctypes.util
 
 from .event import is_event
 
@@ -10,52 +18,252 @@ __author__ = 'tong'
 
 logger = logging.getLogger('stream.logger')
 
+DISCONNECTED = (errno.ECONNRESET, errno.ENOTCONN, errno.ESHUTDOWN, errno.ECONNABORTED, errno.EPIPE, errno.EBADF)
 
-class TCPClient(dispatcher):
-    def __init__(self, address):
-        dispatcher.__init__(self)
-        self.message = None
-        self.iterator = None
-        self._source = None
-        self.address = address
+
+def libc_sendfile():
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    function = libc.sendfile64
+    function.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_int64), ctypes.c_size_t]
+    function.restype = ctypes.c_ssize_t
+
+    def sendfile(out_fd, in_fd, offset, count):
+        sent = function(out_fd, in_fd, ctypes.byref(ctypes.c_int64(offset)), count)
+        if sent < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        return sent
+    return sendfile
+
+
+def sendfile(out_fd, in_fd, offset, count):
+    from sendfile import sendfile
+    return sendfile(out_fd, in_fd, offset, count)
+
+
+if sys.platform.startswith('linux'):
+    sendfile = libc_sendfile()
+
+
+class Loop(object):
+    READ = getattr(select, 'EPOLLIN', getattr(select, 'POLLIN', 1))
+    WRITE = getattr(select, 'EPOLLOUT', getattr(select, 'POLLOUT', 4))
+    ERROR = getattr(select, 'EPOLLERR', getattr(select, 'POLLERR', 8)) | \
+        getattr(select, 'EPOLLHUP', getattr(select, 'POLLHUP', 16))
+    _instance = None
+
+    def __init__(self):
+        if hasattr(select, 'epoll'):
+            self.poller = select.epoll()
+            self.scale = 1
+        else:
+            self.poller = select.poll()
+            self.scale = 1000
+        self.handlers = {}
+        self.timers = []
+        self.counter = 0
+        self.stopped = False
+
+    @classmethod
+    def instance(cls):
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def register(self, handler, events):
+        self.handlers[handler.fileno] = handler
+        self.poller.register(handler.fileno, events)
+
+    def modify(self, handler, events):
+        self.poller.modify(handler.fileno, events)
+
+    def unregister(self, handler):
+        if self.handlers.pop(handler.fileno, None):
+            self.poller.unregister(handler.fileno)
+
+    def call_later(self, delay, callback, *args):
+        self.counter += 1
+        heapq.heappush(self.timers, (time.time() + delay, self.counter, callback, args))
+
+    def stop(self):
+        self.stopped = True
+
+    def run(self):
+        self.stopped = False
+        while not self.stopped and self.handlers:
+            timeout = max(self.timers[0][0] - time.time(), 0) if self.timers else 1
+            try:
+                events = self.poller.poll(timeout * self.scale)
+            except (IOError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, event in events:
+                handler = self.handlers.get(fd)
+                try:
+                    if handler and event & (self.READ | self.ERROR):
+                        handler.handle_read()
+                    if handler and event & self.WRITE and self.handlers.get(fd) is handler:
+                        handler.handle_write()
+                except Exception, e:
+                    handler.handle_error(e)
+            now = time.time()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, callback, args = heapq.heappop(self.timers)
+                callback(*args)
+        if not self.handlers:
+            del self.timers[:]
+
+
+class Dispatcher(object):
+    def __init__(self, sock=None, loop=None):
+        self.loop = loop or Loop.instance()
+        self.socket = None
+        self.fileno = None
+        self.events = 0
+        self.addr = None
+        if sock:
+            self.set_socket(sock)
+
+    def set_socket(self, sock):
+        sock.setblocking(False)
+        self.socket = sock
+        self.fileno = sock.fileno()
+        self.events = Loop.READ
+        self.loop.register(self, self.events)
+
+    def create_socket(self, family, type):
+        self.set_socket(socket.socket(family, type))
+
+    def set_reuse_addr(self):
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,
+                               self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR) | 1)
+
+    def bind(self, address):
+        self.addr = address
+        self.socket.bind(address)
+
+    def listen(self, num):
+        self.socket.listen(num)
+
+    def accept(self):
+        try:
+            return self.socket.accept()
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNABORTED):
+                return None
+            raise
+
+    def connect(self, address):
+        socket_af = socket.AF_UNIX if isinstance(address, basestring) else socket.AF_INET
+        sock = socket.socket(socket_af, socket.SOCK_STREAM)
+        sock.connect(address)
+        self.addr = address
+        self.set_socket(sock)
+        self.handle_connect()
+
+    def writing(self, flag):
+        events = Loop.READ | Loop.WRITE if flag else Loop.READ
+        if self.socket and events != self.events:
+            self.events = events
+            self.loop.modify(self, events)
+
+    def send(self, data):
+        try:
+            return self.socket.send(data)
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return 0
+            if e.errno in DISCONNECTED:
+                self.handle_close()
+                return 0
+            raise
+
+    def recv(self, size):
+        try:
+            data = self.socket.recv(size)
+        except socket.error, e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return ''
+            if e.errno in DISCONNECTED:
+                self.handle_close()
+                return ''
+            raise
+        if not data:
+            self.handle_close()
+        return data
+
+    def detach(self):
+        sock = self.socket
+        self.loop.unregister(self)
+        self.socket = None
+        return sock
+
+    def close(self):
+        if self.socket:
+            self.loop.unregister(self)
+            self.socket.close()
+            self.socket = None
 
     def handle_connect(self):
         pass
 
     def handle_read(self):
-        pass
+        self.recv(65536)
+
+    def handle_write(self):
+        self.writing(False)
 
-    def handle_error(self):
-        logger.error('client[TCP] socket %s error' % str(self.addr))
+    def handle_error(self, e=None):
+        logger.error('socket %s error: %s' % (str(self.addr), e))
         self.handle_close()
 
-    def handle_expt(self):
-        logger.error('client[TCP] socket %s error: unhandled incoming priority event' % self.addr)
+    def handle_close(self):
+        self.close()
+
+
+class TCPClient(Dispatcher):
+    idle = 0.1
+
+    def __init__(self, address):
+        Dispatcher.__init__(self)
+        self.message = ''
+        self.sent = 0
+        self.iterator = None
+        self._source = None
+        self.address = address
+
+    def handle_error(self, e=None):
+        logger.error('client[TCP] socket %s error: %s' % (str(self.addr), e))
+        self.handle_close()
 
     def handle_close(self):
         logger.info('client[TCP] socket %s close' % str(self.addr))
         self.close()
 
-    def writable(self):
-        try:
-            self.message = next(self.iterator)
-            return not is_event(self.message)
-        except StopIteration:
-            self.handle_close()
-            return False
+    def pause(self, delay):
+        self.writing(False)
+        self.loop.call_later(delay, self.writing, True)
 
     def handle_write(self):
-        sent = self.send(self.message+'\n')
-        logger.debug('OUTPUT socket a message(%s)' % sent)
+        if self.sent >= len(self.message):
+            try:
+                message = next(self.iterator)
+            except StopIteration:
+                self.handle_close()
+                return
+            if is_event(message):
+                self.pause(self.idle)
+                return
+            self.message, self.sent = message + '\n', 0
+        self.sent += self.send(buffer(self.message, self.sent))
+        logger.debug('OUTPUT socket a message(%s)' % self.sent)
 
     def start(self):
-        import socket
-        import asyncore
-        socket_af = socket.AF_UNIX if isinstance(self.address, basestring) else socket.AF_INET
-        self.create_socket(socket_af, socket.SOCK_STREAM)
         self.connect(self.address)
         self.iterator = iter(self.source)
-        asyncore.loop(use_poll=True)
+        self.writing(True)
+        self.loop.run()
 
     @property
     def source(self):
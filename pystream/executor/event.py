@@ -27,3 +27,11 @@ class Event(object):
 
 def is_event(obj):
     return isinstance(obj, Enum)
+
+
+class Chunk(list):
+    pass
+
+
+def is_chunk(obj):
+    return isinstance(obj, Chunk)
@@ -3,13 +3,17 @@
 
 import os
 import re
+import sys
 import time
 import json
+import heapq
 import msgpack
 import logging
+import itertools
 
-from .event import Event, is_event
-from .utils import Window, gzip, ungzip
+from .event import Event, Chunk, is_event, is_chunk
+from .aggregator import Aggregator
+from .utils import Window, Reverse, merge, epoch, dump, load, ifilter, gzip, ungzip
 from ..logic import Key, Or, And
 from ..utils import DefaultParser
 from ..logparser.logparser import LogParser
@@ -18,6 +22,8 @@ __author__ = 'tong'
 
 logger = logging.getLogger('stream.logger')
 
+EMPTY = object()
+
 
 class Executor(object):
     def __init__(self, name=None, ignore_exc=True, **kwargs):
@@ -30,11 +36,25 @@ class Executor(object):
     def __iter__(self):
         for item in self.source:
             try:
+                if is_chunk(item):
+                    result = self.handle_batch(item)
+                    if not result:
+                        continue
+                    if not self._output:
+                        for _ in result:
+                            yield _
+                        continue
+                    yield result if is_chunk(result) else Chunk(result)
+                    continue
+
                 if is_event(item):
                     if item == Event.SKIP:
                         continue
                     result = self.handle_event(item)
-                    if result is not None:
+                    if is_chunk(result) and not self._output:
+                        for _ in result:
+                            yield _
+                    elif result is not None:
                         yield result
                     if self._output:
                         yield item
@@ -43,6 +63,8 @@ class Executor(object):
                 result = self.handle(item)
                 if result is not None:
                     yield result
+            except GeneratorExit:
+                raise
             except BaseException, e:
                 if self.ignore_exc:
                     self.handle_exception(item, e)
@@ -52,6 +74,24 @@ class Executor(object):
     def handle(self, item):
         return item
 
+    def handle_batch(self, items):
+        return self._apply(self.handle, items)
+
+    def _apply(self, function, items):
+        results = Chunk()
+        iterator = iter(items)
+        while True:
+            try:
+                for item in iterator:
+                    result = function(item)
+                    if result is not None:
+                        results.append(result)
+                return results
+            except BaseException, e:
+                if not self.ignore_exc:
+                    raise
+                self.handle_exception(item, e)
+
     def handle_exception(self, item, e):
         logger.warn('%s (%s) handled failed, cause: %s, data: %s' % (self.name, self.__class__.__name__, e, [item]))
 
@@ -78,11 +118,24 @@ class Executor(object):
 
 
 class Parser(Executor):
-    def __init__(self, rule=None, trace=False, **kwargs):
+    def __init__(self, rule=None, trace=False, workers=None, chunksize=1000, **kwargs):
         super(Parser, self).__init__(**kwargs)
+        self.rule = rule
         self.trace = trace
+        self.workers = workers
+        self.chunksize = chunksize
         self.parser = LogParser(rule) if rule else DefaultParser()
 
+    def __iter__(self):
+        if not self.workers:
+            return super(Parser, self).__iter__()
+        from .wraps import Parallel
+        parallel = Parallel(Parser(self.rule, self.trace, name=self.name, ignore_exc=self.ignore_exc),
+                            workers=self.workers, chunksize=self.chunksize)
+        parallel._source = self._source
+        parallel._output = self._output
+        return iter(parallel)
+
     def handle(self, item):
         if not item:
             return item
@@ -91,6 +144,19 @@ class Parser(Executor):
             return result
         return result.trace() if self.trace else result.result()
 
+    def handle_batch(self, items):
+        parse = self.parser.parse
+        trace = self.trace
+
+        def handle(item):
+            if not item:
+                return item
+            result = parse(item)
+            if not result:
+                return result
+            return result.trace() if trace else result.result()
+        return self._apply(handle, items)
+
     def handle_exception(self, item, e):
         logger.warn(
             'PARSER PASS %s %s error: %s' % (self.name, type(e).__name__, e),
@@ -103,23 +169,117 @@ class Filter(Executor):
         super(Filter, self).__init__(**kwargs)
         if any([not isinstance(i, (Key, Or, And)) for i in args]):
             raise Exception('Filter args should be in (`Field`, `Or`, `And`)')
-        if not args:
-            self.filter = type('name'.encode('utf8'), (object, ), {'result': lambda s, x: True})()
-        elif len(args) == 1:
+        if len(args) == 1:
             self.filter = args[0]
         else:
             self.filter = And(*args)
+        self.match = self.filter.compile()
 
     def handle(self, item):
-        if self.filter.result(item):
+        if self.match(item):
             return item
         else:
             return None
 
+    def handle_batch(self, items):
+        result = self.match
+        try:
+            return Chunk([_ for _ in items if result(_)])
+        except Exception:
+            return super(Filter, self).handle_batch(items)
+
     def handle_exception(self, item, e):
         logger.warn('Filter %s( %s ) Failed, cause: %s' % (self.name, str(self.filter), e))
 
 
+class Dedup(Executor):
+    def __init__(self, key=None, ttl=3600, capacity=1000000, error_rate=0.001, generations=2,
+                 timestamp=None, cachefile=None, **kwargs):
+        super(Dedup, self).__init__(**kwargs)
+        if generations < 2:
+            raise Exception('Dedup generations should be at least 2')
+        self.key = key or (lambda x: x)
+        self.interval = float(ttl) / (generations - 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = generations
+        self.timestamp = timestamp
+        self.cachefile = cachefile
+        self.generations = []
+        self.seq = 0
+        self.duplicates = 0
+        self.load()
+
+    def __iter__(self):
+        try:
+            for item in super(Dedup, self).__iter__():
+                yield item
+        finally:
+            self.save()
+
+    def handle(self, item):
+        now = epoch(self.timestamp(item)) if self.timestamp else time.time()
+        current = self.generations[-1] if self.generations else None
+        if not current or now - current[1] >= self.interval or current[2] >= self.capacity:
+            if current and now - current[1] < self.interval:
+                logger.warn('Dedup %s generation full after %.0fs, dedup window is shorter than ttl' %
+                            (self.name, now - current[1]))
+            current = self.rotate(now)
+        key = self.key(item)
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        elif not isinstance(key, str):
+            key = repr(key)
+        for generation in reversed(self.generations):
+            if key in generation[3]:
+                self.duplicates += 1
+                return None
+        current[3].add(key)
+        current[2] += 1
+        return item
+
+    def filename(self, seq):
+        return '%s.%s' % (self.cachefile, seq) if self.cachefile else None
+
+    def rotate(self, now):
+        self.seq += 1
+        filename = self.filename(self.seq)
+        if filename and os.path.exists(filename):
+            os.remove(filename)
+        bloom = ifilter('bloom', filename, capacity=self.capacity, error_rate=self.error_rate)
+        self.generations.append([self.seq, now, 0, bloom])
+        while len(self.generations) > self.size:
+            filename = self.filename(self.generations.pop(0)[0])
+            if filename and os.path.exists(filename):
+                os.remove(filename)
+        self.save()
+        return self.generations[-1]
+
+    def load(self):
+        if not self.cachefile or not os.path.exists(self.cachefile):
+            return
+        with open(self.cachefile) as fp:
+            meta = json.load(fp)
+        self.seq = meta['seq']
+        for seq, created, count in meta['generations']:
+            filename = self.filename(seq)
+            if not os.path.exists(filename):
+                continue
+            if not self.timestamp and created + self.size * self.interval < time.time():
+                os.remove(filename)
+                continue
+            self.generations.append([seq, created, count, ifilter('bloom', filename)])
+        logger.info('Dedup %s loaded %s generations from %s' % (self.name, len(self.generations), self.cachefile))
+
+    def save(self):
+        if not self.cachefile:
+            return
+        meta = {'seq': self.seq, 'generations': [_[:3] for _ in self.generations]}
+        with open(self.cachefile + '.tmp', 'w') as fp:
+            json.dump(meta, fp)
+        os.rename(self.cachefile + '.tmp', self.cachefile)
+
+
 class Map(Executor):
     def __init__(self, function, **kwargs):
         super(Map, self).__init__(**kwargs)
@@ -127,75 +287,173 @@ class Map(Executor):
 
     def handle(self, item):
         return self.func(item)
-    
+
+    def handle_batch(self, items):
+        return self._apply(self.func, items)
+
 
 class Sort(Executor):
-    def __init__(self, maxlen=None, key=None, desc=False, maxsize=None, cache_path=None, **kwargs):
+    def __init__(self, maxlen=None, key=None, desc=False, maxsize=None, cache_path=None, emit='item', **kwargs):
         super(Sort, self).__init__(**kwargs)
+        if emit not in ('item', 'end'):
+            raise Exception('Sort emit should be in (`item`, `end`)')
         self.maxlen = maxlen
         self.maxsize = maxsize
+        self.emit = emit
         self.items = []
         self.files = []
-        self.length = 0
-        self.key = key or (lambda x: x)
+        self.sorted = True
+        self.key = key
         self.desc = desc
         self.cache_path = cache_path or '/tmp/pystream_sort_%s' % time.time()
+        self.created = False
+        self.view = self.Iterable(self)
+
+    def __iter__(self):
+        try:
+            for item in super(Sort, self).__iter__():
+                yield item
+            if self.emit == 'end':
+                for item in self.view:
+                    yield item
+        finally:
+            self.clear()
 
     def handle(self, item):
-        self.insert(item)
+        self.items.append(item)
+        self.sorted = False
         if self.maxlen:
-            if len(self.items) > self.maxlen:
-                self.items = self.items[:self.maxlen]
-        elif self.maxsize and self.length > self.maxsize:
-            if not os.path.exists(self.cache_path):
-                os.makedirs(self.cache_path)
-            filename = os.path.join(self.cache_path, str(time.time()))
-            fp = open(filename, 'w')
-            fp.write('\n'.join([_ for _ in self.items]))
-            fp.close()
-            self.files.append(filename)
-            self.length = 0
-            self.items = []
-        return self.Iterable(self)
-
-    def insert(self, item):
-        l = 0
-        r = len(self.items)-1
-        compare = (lambda x, y: x > y) if self.desc else (lambda x, y: x < y)
-        while l <= r:
-            m = (l + r)/2
-            value1 = self.key(self.items[m])
-            value2 = self.key(item)
-            if value1 == value2:
-                break
-            elif compare(value1, value2):
-                l = m + 1
-            else:
-                r = m - 1
-        self.items.insert((l + r)/2+1, item)
-        if self.maxsize:
-            self.length += len(item)
+            if len(self.items) >= 2 * self.maxlen:
+                self.sort()
+        elif self.maxsize and len(self.items) >= self.maxsize:
+            self.spill()
+        if self.emit == 'item':
+            return self.view
+        return None
+
+    def sort(self):
+        if self.sorted:
+            return
+        self.items.sort(key=self.key, reverse=self.desc)
+        if self.maxlen:
+            del self.items[self.maxlen:]
+        self.sorted = True
+
+    def spill(self):
+        self.sort()
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path)
+            self.created = True
+        self.files.append(dump(self.items, self.cache_path))
+        self.items = []
+
+    def clear(self):
+        for filename in self.files:
+            if os.path.exists(filename):
+                os.remove(filename)
+        self.files = []
+        if self.created and os.path.exists(self.cache_path) and not os.listdir(self.cache_path):
+            os.rmdir(self.cache_path)
+        self.created = False
 
     class Iterable(object):
         def __init__(self, exe):
             self.exe = exe
-            self.func = max if exe.desc else min
 
         def __iter__(self):
-            if not self.exe.maxsize:
+            self.exe.sort()
+            if not self.exe.files:
                 for item in self.exe.items:
                     yield item
                 return
-            fps = [iter(self.exe.items)] if self.exe.items else []
-            fps += [open(_) for _ in self.exe.files]
-            fps = [[_, next(_).strip('\n')] for _ in fps]
-            while fps:
-                item = self.func(fps, key=(lambda x: self.exe.key(x[1])))
-                yield item[1]
-                try:
-                    item[1] = next(item[0]).strip('\n')
-                except StopIteration:
-                    fps.remove(item)
+            runs = [load(_) for _ in self.exe.files] + [self.exe.items]
+            for item in merge(runs, self.exe.key, self.exe.desc):
+                yield item
+
+
+class TopK(Executor):
+    def __init__(self, k, key=None, desc=False, emit='item', **kwargs):
+        super(TopK, self).__init__(**kwargs)
+        if emit not in ('item', 'idle', 'end'):
+            raise Exception('%s emit should be in (`item`, `idle`, `end`)' % self.__class__.__name__)
+        self.k = k
+        self.key = key or (lambda x: x)
+        self.wrap = (lambda x: x) if desc else Reverse
+        self.desc = desc
+        self.emit = emit
+        self.counter = 0
+        self.heap = []
+        self.changed = False
+
+    def __iter__(self):
+        for item in super(TopK, self).__iter__():
+            yield item
+        if self.changed and self.emit != 'item':
+            yield self.result(self.heap)
+
+    def push(self, heap, item):
+        value = self.key(item)
+        if len(heap) >= self.k:
+            bound = heap[0][0]
+            if self.desc:
+                if not bound < value:
+                    return False
+            elif not value < bound.value:
+                return False
+        self.counter += 1
+        entry = [self.wrap(value), -self.counter, item]
+        if len(heap) < self.k:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heapreplace(heap, entry)
+        return True
+
+    def result(self, heap):
+        self.changed = False
+        return [_[2] for _ in sorted(heap, reverse=True)]
+
+    def handle(self, item):
+        if not self.push(self.heap, item):
+            return None
+        self.changed = True
+        if self.emit == 'item':
+            return self.result(self.heap)
+
+    def handle_event(self, event):
+        if event == Event.IDLE and self.emit == 'idle' and self.changed:
+            return self.result(self.heap)
+
+
+class TopKbyKey(TopK):
+    def __init__(self, k, key=None, desc=False, emit='item', **kwargs):
+        super(TopKbyKey, self).__init__(k, key, desc, emit, **kwargs)
+        self.heaps = {}
+        self.groups = set()
+
+    def __iter__(self):
+        for item in super(TopK, self).__iter__():
+            yield item
+        if self.emit != 'item':
+            for result in self.results():
+                yield result
+
+    def results(self):
+        results = Chunk([(group, self.result(self.heaps[group])) for group in self.groups])
+        self.groups = set()
+        return results
+
+    def handle(self, item):
+        group, item = item
+        heap = self.heaps.setdefault(group, [])
+        if not self.push(heap, item):
+            return None
+        if self.emit == 'item':
+            return group, self.result(heap)
+        self.groups.add(group)
+
+    def handle_event(self, event):
+        if event == Event.IDLE and self.emit == 'idle' and self.groups:
+            return self.results()
 
 
 class Reduce(Executor):
@@ -213,43 +471,251 @@ class Reduce(Executor):
 
 
 class ReducebyKey(Executor):
-    def __init__(self, function, **kwargs):
+    def __init__(self, function, emit=None, every=None, interval=None, maxkeys=None, cache_path=None, **kwargs):
         super(ReducebyKey, self).__init__(**kwargs)
-        self.func = function
+        if emit == 'item' and (every or interval):
+            raise Exception('ReducebyKey every/interval do not work with emit=`item`')
+        emit = emit or ('end' if every or interval or maxkeys else 'item')
+        if emit not in ('item', 'idle', 'end'):
+            raise Exception('ReducebyKey emit should be in (`item`, `idle`, `end`)')
+        if maxkeys and (emit != 'end' or every or interval):
+            raise Exception('ReducebyKey maxkeys only works with emit=`end`')
+        self.aggregator = function if isinstance(function, Aggregator) else None
+        self.func = self.aggregator.add if self.aggregator else function
+        self.combine = self.aggregator.merge if self.aggregator else function
+        self.emit = emit
+        self.every = every
+        self.interval = interval
+        self.maxkeys = maxkeys
         self.data = {}
+        self.dirty = set()
+        self.touched = {}
+        self.count = 0
+        self.timer = time.time()
+        self.files = []
+        self.spilled = 0
+        self.cache_path = cache_path or '/tmp/pystream_reduce_%s' % time.time()
+        self.created = False
+
+    def __iter__(self):
+        try:
+            for item in super(ReducebyKey, self).__iter__():
+                if is_chunk(item) and not self._output:
+                    for _ in item:
+                        yield _
+                else:
+                    yield item
+            if self.emit == 'end' and not (self.every or self.interval):
+                for item in self.merged():
+                    yield item
+            elif self.dirty:
+                for item in self.flush():
+                    yield item
+        finally:
+            self.clear()
 
     def handle(self, item):
         key, item = item
-        if key not in self.data:
-            self.data[key] = item
+        data = self.data
+        if key in data:
+            data[key] = self.func(data[key], item)
+        elif self.aggregator:
+            data[key] = self.func(self.aggregator.initial(), item)
         else:
-            self.data[key] = self.func(self.data[key], item)
-        return key, self.data[key]
+            data[key] = item
+        if self.emit == 'item':
+            return key, self.output(data[key])
+        self.count += 1
+        if self.maxkeys:
+            self.touched[key] = self.count
+            if len(data) > self.maxkeys:
+                self.spill()
+            return None
+        self.dirty.add(key)
+        if self.due():
+            return self.flush()
+        return None
+
+    def handle_batch(self, items):
+        results = self._apply(self.handle, items)
+        if self.emit == 'item':
+            return results
+        return Chunk([_ for result in results for _ in result])
+
+    def handle_event(self, event):
+        if event == Event.IDLE and self.dirty and (self.emit == 'idle' or self.due()):
+            return self.flush()
+
+    def due(self):
+        if self.every and self.count >= self.every:
+            return True
+        if self.interval and time.time() - self.timer >= self.interval:
+            return True
+        return False
+
+    def flush(self):
+        data = self.data
+        result = Chunk([(key, self.output(data[key])) for key in self.dirty])
+        self.dirty = set()
+        self.count = 0
+        self.timer = time.time()
+        return result
+
+    def spill(self):
+        touched = self.touched
+        keys = sorted(touched, key=touched.get)[:len(touched) / 2]
+        keys.sort()
+        if not os.path.exists(self.cache_path):
+            os.makedirs(self.cache_path)
+            self.created = True
+        data = self.data
+        self.files.append(dump([(key, data[key]) for key in keys], self.cache_path))
+        for key in keys:
+            del data[key]
+            del touched[key]
+        self.spilled += len(keys)
+
+    def merged(self):
+        if not self.files:
+            for key, value in self.data.iteritems():
+                yield key, self.output(value)
+            return
+        runs = [load(_) for _ in self.files] + [sorted(self.data.iteritems())]
+        key, value = None, None
+        first = True
+        for k, v in merge(runs, lambda x: x[0]):
+            if first:
+                key, value, first = k, v, False
+            elif k == key:
+                value = self.combine(value, v)
+            else:
+                yield key, self.output(value)
+                key, value = k, v
+        if not first:
+            yield key, self.output(value)
+
+    def output(self, value):
+        if self.aggregator:
+            return self.aggregator.result(value)
+        return value
+
+    def clear(self):
+        for filename in self.files:
+            if os.path.exists(filename):
+                os.remove(filename)
+        self.files = []
+        if self.created and os.path.exists(self.cache_path) and not os.listdir(self.cache_path):
+            os.rmdir(self.cache_path)
+        self.created = False
+
+    @property
+    def status(self):
+        data = self.data
+        memsize = sys.getsizeof(data)
+        if data:
+            sample = list(itertools.islice(data.iteritems(), 100))
+            size = sum([sys.getsizeof(k) + sys.getsizeof(v) for k, v in sample])
+            memsize += size * len(data) / len(sample)
+        return {'keys': len(data), 'memsize': memsize, 'spilled': self.spilled, 'filenum': len(self.files),
+                'filesize': sum([os.path.getsize(_) for _ in self.files if os.path.exists(_)])}
+
+
+class Combine(Executor):
+    def __init__(self, function, maxkeys=10000, **kwargs):
+        super(Combine, self).__init__(**kwargs)
+        self.aggregator = function if isinstance(function, Aggregator) else None
+        self.func = self.aggregator.add if self.aggregator else function
+        self.maxkeys = maxkeys
+        self.data = {}
+
+    def __iter__(self):
+        for item in super(Combine, self).__iter__():
+            if is_chunk(item) and not self._output:
+                for _ in item:
+                    yield _
+            else:
+                yield item
+        if self.data:
+            for item in self.flush():
+                yield item
+
+    def handle(self, item):
+        key, item = item
+        data = self.data
+        if key in data:
+            data[key] = self.func(data[key], item)
+            return None
+        result = None
+        if len(data) >= self.maxkeys:
+            result = self.flush()
+        self.data[key] = self.func(self.aggregator.initial(), item) if self.aggregator else item
+        return result
+
+    def handle_batch(self, items):
+        return Chunk([_ for result in self._apply(self.handle, items) for _ in result])
+
+    def flush(self):
+        result = Chunk(self.data.iteritems())
+        self.data = {}
+        return result
 
 
 class ReducebySortedKey(Executor):
-    def __init__(self, function, **kwargs):
+    def __init__(self, function, type=None, **kwargs):
         super(ReducebySortedKey, self).__init__(**kwargs)
-        self.func = function
-        self.key = None
+        self.aggregator = function if isinstance(function, Aggregator) else None
+        self.func = self.aggregator.merge if self.aggregator else function
+        self.type = type
+        self.key = EMPTY
         self.value = None
 
     def handle(self, item):
         key, value = item
+        if self.type:
+            value = self.type(value)
         if key == self.key:
             self.value = self.func(self.value, value)
             return None
-        result = (self.key, self.value)
+        result = (self.key, self.output(self.value))
         self.key = key
         self.value = value
-        if result[0]:
+        if result[0] is not EMPTY:
             return result
 
+    def output(self, value):
+        if self.aggregator:
+            return self.aggregator.result(value)
+        return value
+
     def __iter__(self):
         for item in super(ReducebySortedKey, self).__iter__():
             yield item
-        if self.key:
-            yield self.key, self.value
+        if self.key is not EMPTY:
+            yield self.key, self.output(self.value)
+
+
+class GroupbySortedKey(Executor):
+    def __init__(self, key=None, value=None, aggregator=None, **kwargs):
+        super(GroupbySortedKey, self).__init__(**kwargs)
+        self.key = key or (lambda x: x[0])
+        self.value = value or ((lambda x: x[1]) if key is None else (lambda x: x))
+        self.aggregator = aggregator
+
+    def __iter__(self):
+        for key, group in itertools.groupby(self.items(), self.key):
+            values = itertools.imap(self.value, group)
+            if self.aggregator:
+                yield key, self.aggregator(values)
+            else:
+                yield key, values
+
+    def items(self):
+        for item in self.source:
+            if is_chunk(item):
+                for _ in item:
+                    yield _
+            elif not is_event(item):
+                yield item
 
 
 class Group(Executor):
@@ -279,14 +745,146 @@ class Group(Executor):
         return None
 
 
+class Windowed(Executor):
+    def __init__(self, window, timestamp=None, key=None, initial=None, add=None, merge=None, result=None,
+                 aggregator=None, lateness=0, idle=True, **kwargs):
+        super(Windowed, self).__init__(**kwargs)
+        self.window = window
+        self.timestamp = timestamp
+        self.key = key
+        if aggregator:
+            initial, add, merge, result = aggregator.initial, aggregator.add, aggregator.merge, aggregator.result
+        self.initial = initial or list
+        self.add = add or (lambda x, y: x.append(y) or x)
+        self.merge = merge or (lambda x, y: x + y)
+        self.result = result or (lambda x: x)
+        self.lateness = lateness
+        self.idle = idle
+        self.panes = {}
+        self.timers = []
+        self.counter = 0
+        self.maxtime = None
+        self.arrival = None
+        self.late = 0
+
+    def __iter__(self):
+        for item in super(Windowed, self).__iter__():
+            if is_chunk(item) and not self._output:
+                for _ in item:
+                    yield _
+            else:
+                yield item
+        for item in self.fire():
+            yield item
+
+    @property
+    def watermark(self):
+        if self.maxtime is None:
+            return None
+        return self.maxtime - self.lateness
+
+    def handle(self, item):
+        self.arrival = time.time()
+        timestamp = epoch(self.timestamp(item)) if self.timestamp else self.arrival
+        key = self.key(item) if self.key else None
+        if self.maxtime is None or timestamp > self.maxtime:
+            self.maxtime = timestamp
+        watermark = self.watermark
+        windows = [_ for _ in self.window.assign(timestamp) if _[1] > watermark]
+        if not windows:
+            self.late += 1
+            return None
+        panes = self.panes.setdefault(key, {})
+        if self.window.merging:
+            self.assign(key, panes, windows[0], self.add(self.initial(), item))
+        else:
+            for window in windows:
+                if window not in panes:
+                    panes[window] = self.add(self.initial(), item)
+                    self.schedule(key, window)
+                else:
+                    panes[window] = self.add(panes[window], item)
+        if self.timers[0][0] <= watermark:
+            return self.fire(watermark) or None
+        return None
+
+    def handle_batch(self, items):
+        return Chunk([_ for result in self._apply(self.handle, items) for _ in result])
+
+    def handle_event(self, event):
+        if event == Event.IDLE and self.idle and self.timers:
+            now = time.time()
+            self.maxtime += now - self.arrival
+            self.arrival = now
+            return self.fire(self.watermark) or None
+
+    def assign(self, key, panes, window, value):
+        start, end = window
+        for pane in panes.keys():
+            if pane[0] <= end and start <= pane[1]:
+                value = self.merge(panes.pop(pane), value)
+                start = min(start, pane[0])
+                end = max(end, pane[1])
+        panes[(start, end)] = value
+        self.schedule(key, (start, end))
+
+    def schedule(self, key, window):
+        self.counter += 1
+        heapq.heappush(self.timers, (window[1], self.counter, key, window))
+
+    def fire(self, watermark=None):
+        results = Chunk()
+        timers = self.timers
+        while timers and (watermark is None or timers[0][0] <= watermark):
+            _, _, key, window = heapq.heappop(timers)
+            panes = self.panes.get(key)
+            if not panes or window not in panes:
+                continue
+            value = self.result(panes.pop(window))
+            if not panes:
+                del self.panes[key]
+            results.append((key, window, value) if self.key else (window, value))
+        return results
+
+
+class Batched(Group):
+    def __init__(self, size=1000, timeout=None, **kwargs):
+        super(Batched, self).__init__(Chunk, size, timeout, **kwargs)
+
+    def handle_event(self, event):
+        if not self.window.empty:
+            return self.func(self.window.data)
+
+    def handle_batch(self, items):
+        if self.window.empty:
+            return items
+        return self.window.data + items
+
+
 class JsonDumps(Executor):
+    def __init__(self, **kwargs):
+        super(JsonDumps, self).__init__(**kwargs)
+        kwargs = dict(self.kwargs)
+        self.encoder = (kwargs.pop('cls', None) or json.JSONEncoder)(**kwargs)
+
     def handle(self, item):
-        return json.dumps(item, **self.kwargs)
+        return self.encoder.encode(item)
+
+    def handle_batch(self, items):
+        return self._apply(self.encoder.encode, items)
 
 
 class JsonLoads(Executor):
+    def __init__(self, **kwargs):
+        super(JsonLoads, self).__init__(**kwargs)
+        kwargs = dict(self.kwargs)
+        self.decoder = (kwargs.pop('cls', None) or json.JSONDecoder)(**kwargs)
+
     def handle(self, item):
-        return json.loads(item, **self.kwargs)
+        return self.decoder.decode(item)
+
+    def handle_batch(self, items):
+        return self._apply(self.decoder.decode, items)
 
 
 class MsgpackDumps(Executor):
@@ -338,6 +936,9 @@ class Iterator(Executor):
             if is_event(items) and self._output:
                 yield items
                 continue
+            if is_chunk(items):
+                yield Chunk([self.func(item) for _ in items for item in _])
+                continue
             for item in items:
                 yield self.func(item)
 
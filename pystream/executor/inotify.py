@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+__author__ = 'tong'
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+EVENT = struct.Struct('iIII')
+
+
+class INotify(object):
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+        self.watches = {}
+
+    def watch(self, path, mask):
+        wd = self._add_watch(self.fd, path, mask)
+        if wd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, '%s: %s' % (os.strerror(code), path))
+        self.watches[wd] = path
+        return wd
+
+    def unwatch(self, wd):
+        if self.watches.pop(wd, None) is not None:
+            self._rm_watch(self.fd, wd)
+
+    def read(self, timeout=None):
+        if not self.poller.poll(None if timeout is None else int(timeout * 1000)):
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, pos)
+            pos += EVENT.size
+            name = data[pos:pos+length].rstrip('\0')
+            pos += length
+            events.append((self.watches.get(wd), mask, cookie, name))
+        return events
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import time
+import heapq
+import struct
+import cPickle
+import hashlib
+import logging
+import msgpack
+import threading
+
+from output import Output
+from executor import Executor, EMPTY
+from event import Event, Chunk, is_event, is_chunk
+from utils import epoch, merge, dump, load
+
+__author__ = 'tong'
+
+logger = logging.getLogger('stream.logger')
+
+
+class DiskIndex(object):
+    entry = struct.Struct('<QQI')
+
+    def __init__(self, path, chunksize=1000000):
+        self.path = path
+        self.chunksize = chunksize
+        self.data = None
+        self.index = None
+        self.size = 0
+
+    @classmethod
+    def normalize(cls, key):
+        if isinstance(key, unicode):
+            return key.encode('utf-8')
+        if isinstance(key, (list, tuple)):
+            return tuple([cls.normalize(_) for _ in key])
+        return key
+
+    @staticmethod
+    def hash(key):
+        return struct.unpack('<Q', hashlib.md5(msgpack.packb(key, use_bin_type=True)).digest()[:8])[0]
+
+    def build(self, items):
+        entries = []
+        runs = []
+        path = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with open(self.path + '.data.tmp', 'wb') as fp:
+                offset = 0
+                for key, value in items:
+                    key = self.normalize(key)
+                    data = cPickle.dumps((key, value), cPickle.HIGHEST_PROTOCOL)
+                    fp.write(data)
+                    entries.append((self.hash(key), offset, len(data)))
+                    offset += len(data)
+                    if len(entries) >= self.chunksize:
+                        entries.sort()
+                        runs.append(dump(entries, path))
+                        entries = []
+            entries.sort()
+            with open(self.path + '.index.tmp', 'wb') as fp:
+                for entry in merge([load(_) for _ in runs] + [entries]):
+                    fp.write(self.entry.pack(*entry))
+        finally:
+            for filename in runs:
+                os.remove(filename)
+        os.rename(self.path + '.data.tmp', self.path + '.data')
+        os.rename(self.path + '.index.tmp', self.path + '.index')
+        return self.open()
+
+    def open(self):
+        self.data = self.map(self.path + '.data')
+        self.index = self.map(self.path + '.index')
+        self.size = len(self.index) / self.entry.size
+        return self
+
+    @staticmethod
+    def map(filename):
+        with open(filename, 'rb') as fp:
+            if not os.fstat(fp.fileno()).st_size:
+                return ''
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, key, default=None):
+        key = self.normalize(key)
+        code = self.hash(key)
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if self.entry.unpack_from(self.index, mid * self.entry.size)[0] < code:
+                lo = mid + 1
+            else:
+                hi = mid
+        result = default
+        while lo < self.size:
+            value, offset, length = self.entry.unpack_from(self.index, lo * self.entry.size)
+            if value != code:
+                break
+            k, v = cPickle.loads(self.data[offset: offset + length])
+            if k == key:
+                result = v
+            lo += 1
+        return result
+
+    def __len__(self):
+        return self.size
+
+
+class Lookup(Executor):
+    def __init__(self, table, key, side_key=None, value=None, how='inner', merge=None,
+                 interval=None, path=None, **kwargs):
+        super(Lookup, self).__init__(**kwargs)
+        if how not in ('inner', 'left'):
+            raise Exception('Lookup how should be in (`inner`, `left`)')
+        self.table = table
+        self.key = key
+        self.side_key = side_key or (lambda x: x[0])
+        self.value = value or (lambda x: x)
+        self.how = how
+        self.merge = merge or (lambda x, y: (x, y))
+        self.interval = interval
+        self.path = path
+        self.index = None
+        self.loaded = None
+
+    def __iter__(self):
+        self.load()
+        stopped = threading.Event()
+        if self.interval:
+            thread = threading.Thread(target=self.reload, args=(stopped, ))
+            thread.setDaemon(True)
+            thread.start()
+        try:
+            for item in super(Lookup, self).__iter__():
+                yield item
+        finally:
+            stopped.set()
+
+    def rows(self):
+        table = self.table() if callable(self.table) else self.table
+        for row in table:
+            if is_chunk(row):
+                for _ in row:
+                    yield self.side_key(_), self.value(_)
+            elif not is_event(row):
+                yield self.side_key(row), self.value(row)
+
+    def load(self):
+        timer = time.time()
+        if self.path:
+            self.index = DiskIndex(self.path).build(self.rows())
+        else:
+            self.index = dict(self.rows())
+        self.loaded = time.time()
+        logger.info('LOOKUP %s loaded %s rows in %.3fs' % (self.name, len(self.index), self.loaded - timer))
+
+    def reload(self, stopped):
+        while not stopped.wait(self.interval):
+            try:
+                self.load()
+            except Exception, e:
+                logger.error('LOOKUP %s reload failed, cause: %s' % (self.name, e))
+
+    def handle(self, item):
+        row = self.index.get(self.key(item), EMPTY)
+        if row is EMPTY:
+            if self.how == 'inner':
+                return None
+            row = None
+        return self.merge(item, row)
+
+
+class Join(Executor):
+    def __init__(self, left, right, key, timestamp, within=0, lateness=0, merge=None,
+                 unmatched=None, maxsize=None, **kwargs):
+        super(Join, self).__init__(**kwargs)
+        self.sources = (left, right)
+        self.keys = key if isinstance(key, (list, tuple)) else (key, key)
+        self.timestamps = timestamp if isinstance(timestamp, (list, tuple)) else (timestamp, timestamp)
+        self.within = within
+        self.lateness = lateness
+        self.merge = merge or (lambda x, y: (x, y))
+        if isinstance(unmatched, Output):
+            self.unmatched = lambda side, item: unmatched.handle((side, item))
+        else:
+            self.unmatched = unmatched
+        self.maxsize = maxsize
+        self.state = ({}, {})
+        self.timers = ([], [])
+        self.maxtime = [None, None]
+        self.alive = [True, True]
+        self.counter = 0
+        self.metrics = {'matched': 0, 'unmatched': 0, 'evicted': 0, 'late': 0}
+
+    def __iter__(self):
+        for item in super(Join, self).__iter__():
+            if is_chunk(item) and not self._output:
+                for _ in item:
+                    yield _
+            else:
+                yield item
+        for side in (0, 1):
+            self.evict(side, None)
+
+    @property
+    def _source(self):
+        return None
+
+    @_source.setter
+    def _source(self, value):
+        if value is not None:
+            raise Exception('Join reads its own left and right sources and can not be piped into')
+
+    @property
+    def source(self):
+        iterators = [iter(_) for _ in self.sources]
+        heads = [None, None]
+        while self.alive[0] or self.alive[1] or heads[0] or heads[1]:
+            for side in (0, 1):
+                if not self.alive[side] or heads[side]:
+                    continue
+                try:
+                    item = next(iterators[side])
+                except StopIteration:
+                    self.alive[side] = False
+                    continue
+                if is_event(item):
+                    if item == Event.IDLE:
+                        yield item
+                    continue
+                try:
+                    heads[side] = (side, epoch(self.timestamps[side](item)), item)
+                except Exception, e:
+                    self.handle_exception(item, e)
+            ready = [_ for _ in heads if _]
+            if not ready:
+                continue
+            head = min(ready, key=lambda x: x[1])
+            heads[head[0]] = None
+            yield head
+
+    def handle(self, item):
+        side, timestamp, item = item
+        other = 1 - side
+        key = self.keys[side](item)
+        if self.maxtime[side] is None or timestamp > self.maxtime[side]:
+            self.maxtime[side] = timestamp
+        entry = [timestamp, item, False]
+        results = Chunk()
+        for _ in self.state[other].get(key, ()):
+            if abs(_[0] - timestamp) <= self.within:
+                _[2] = entry[2] = True
+                results.append(self.merge(item, _[1]) if side == 0 else self.merge(_[1], item))
+        self.metrics['matched'] += len(results)
+        watermark = self.watermark(side)
+        if watermark is not None and timestamp + self.within < watermark:
+            self.metrics['late'] += 1
+            if not entry[2]:
+                self.drop(side, item)
+        else:
+            self.state[side].setdefault(key, []).append(entry)
+            self.counter += 1
+            heapq.heappush(self.timers[side], (timestamp, self.counter, key, entry))
+            if self.maxsize and len(self.timers[side]) > self.maxsize:
+                self.metrics['evicted'] += 1
+                self.pop(side)
+        watermark = self.watermark(other)
+        if watermark is not None:
+            self.evict(other, watermark)
+        return results or None
+
+    def handle_batch(self, items):
+        return Chunk([_ for result in self._apply(self.handle, items) for _ in result])
+
+    def watermark(self, side):
+        other = 1 - side
+        if not self.alive[other]:
+            return float('inf')
+        if self.maxtime[other] is None:
+            return None
+        return self.maxtime[other] - self.lateness
+
+    def evict(self, side, watermark):
+        timers = self.timers[side]
+        while timers and (watermark is None or timers[0][0] + self.within < watermark):
+            self.pop(side)
+
+    def pop(self, side):
+        timestamp, _, key, entry = heapq.heappop(self.timers[side])
+        entries = self.state[side][key]
+        for index, _ in enumerate(entries):
+            if _ is entry:
+                del entries[index]
+                break
+        if not entries:
+            del self.state[side][key]
+        if not entry[2]:
+            self.drop(side, entry[1])
+
+    def drop(self, side, item):
+        self.metrics['unmatched'] += 1
+        if self.unmatched:
+            self.unmatched('right' if side else 'left', item)
+
+    @property
+    def status(self):
+        status = dict(self.metrics)
+        status['left'] = len(self.timers[0])
+        status['right'] = len(self.timers[1])
+        status['keys'] = len(self.state[0]) + len(self.state[1])
+        status['watermark'] = [self.watermark(1), self.watermark(0)]
+        return status
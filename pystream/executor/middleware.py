@@ -2,17 +2,19 @@
 # -*- coding: utf-8 -*-
 
 import os
-import sys
 import time
+import errno
 import json
+import struct
 import socket
 import logging
 import multiprocessing
 from random import randint
-from asyncore import dispatcher
 
-from async import TCPClient
-from utils import Window, start_process, endpoint
+from async import Loop, Dispatcher, TCPClient, DISCONNECTED, sendfile
+from storage import Log, Reader, decode
+from utils import Window, start_process
+from event import is_event
 from executor import Executor, Group, Iterator
 
 
@@ -21,6 +23,12 @@ __all__ = ['Queue', 'Subscribe']
 
 logger = logging.getLogger('stream.logger')
 
+CHUNK = struct.Struct('>II')
+BATCH = struct.Struct('>II')
+RECORD = struct.Struct('>HI')
+ACK = struct.Struct('>I')
+LOCAL = struct.Struct('>IQQI')
+
 
 class Queue(Executor):
     EOF = type('EOF', (object, ), {})()
@@ -53,13 +61,17 @@ class Queue(Executor):
 
 class Subscribe(Executor):
     def __init__(self, address=None, cache_path=None, maxsize=1024*1024,
-                 listen_num=5, archive_size=1024*1024*1024, **kwargs):
+                 listen_num=1024, archive_size=1024*1024*1024, retention_size=None, retention_time=None,
+                 partitions=1, **kwargs):
         self.mutex = multiprocessing.Lock()
         self.sensor = None
         self.server = None
         self.maxsize = maxsize
         self.listen_num = listen_num
         self.archive_size = archive_size or 1024*1024*1024
+        self.retention_size = retention_size
+        self.retention_time = retention_time
+        self.partitions = partitions
         self.cache_path = cache_path or '/tmp/pystream_data_%s' % time.time()
         if hasattr(socket, 'AF_UNIX'):
             self.address = address or '/tmp/pystream_sock_%s' % time.time()
@@ -81,15 +93,18 @@ class Subscribe(Executor):
         return Sensor(self.address)
 
     def start(self):
-        import asyncore
         if self._source and not self.sensor:
             self.sensor = start_process(self.init_sensor)
-        TCPServer(self.address, self.cache_path, self.maxsize, self.listen_num, self.archive_size)
-        asyncore.loop()
+        TCPServer(self.address, self.cache_path, self.maxsize, self.listen_num, self.archive_size,
+                  self.retention_size, self.retention_time, self.partitions)
+        Loop.instance().run()
 
     def status(self, topic):
         return self._get('topic %s' % topic)
 
+    def lag(self, group):
+        return self._get('group %s' % group)
+
     def stop(self):
         return self._get('stop')
 
@@ -101,29 +116,103 @@ class Subscribe(Executor):
         raise Exception('please use `[]` to choose topic')
 
     def __getitem__(self, name):
+        if isinstance(name, basestring):
+            return self.consumer(name)
+        if len(name) == 3:
+            topic, partition, offset = name
+            return self.consumer(topic, offset=offset, partition=partition)
+        topic, option = name
+        if isinstance(option, basestring):
+            return self.consumer(topic, group=option)
+        return self.consumer(topic, offset=option)
+
+    def consumer(self, topic, group=None, offset=0, interval=5, local=False, partition=None):
         import source
+        path = os.path.join(self.cache_path, topic)
 
         class Receiver(source.TCPClient):
+            buffer_size = 1024*1024
+
             def initialize(self):
                 sock = super(Receiver, self).initialize()
-                if isinstance(name, basestring):
-                    sock.send('0{"topic": "%s"}\n' % name)
-                elif len(name) == 2:
-                    sock.send('0{"topic": "%s", "number": %s}\n' % name)
-                else:
-                    sock.send('0{"topic": "%s", "number": %s, "offset": %s}\n' % name)
+                sock.send('0%s\n' % json.dumps({'topic': topic, 'group': group, 'offset': offset, 'local': local,
+                                                 'partition': partition}))
+                self.sock = sock
+                self.started = False
+                self.chunk = None
+                self.buffers = {}
+                self.readers = {}
                 return sock
 
+            def handle(self, message):
+                if not self.started:
+                    message = message.lstrip('\n')
+                    self.started = bool(message)
+                if local:
+                    return self.locate(message)
+                items = []
+                start = 0
+                while True:
+                    if not self.chunk:
+                        if len(message) - start < CHUNK.size:
+                            break
+                        self.chunk = list(CHUNK.unpack_from(message, start))
+                        start += CHUNK.size
+                    partition, length = self.chunk
+                    data = message[start: start + length]
+                    if not data:
+                        break
+                    start += len(data)
+                    self.chunk[1] -= len(data)
+                    if not self.chunk[1]:
+                        self.chunk = None
+                    data = self.buffers.get(partition, '') + data
+                    records, end = decode(data)
+                    self.buffers[partition] = data[end:]
+                    items.extend([(partition, _, record) for _, record in records])
+                return message[start:], items
+
+            def locate(self, message):
+                items = []
+                start = 0
+                while len(message) - start >= LOCAL.size:
+                    partition, base, position, length = LOCAL.unpack_from(message, start)
+                    start += LOCAL.size
+                    if partition not in self.readers:
+                        self.readers[partition] = [Reader(os.path.join(path, str(partition))), None, 0]
+                    reader = self.readers[partition]
+                    if reader[1] != base:
+                        reader[1:] = [base, position]
+                    records, reader[2] = reader[0].read(base, reader[2], position + length)
+                    items.extend([(partition, _, record) for _, record in records])
+                return message[start:], items
+
+            def commit(self, offsets):
+                try:
+                    self.sock.sendall('%s\n' % json.dumps({'commit': offsets}))
+                except socket.error, e:
+                    logger.warn('SUBSCRIBE group [%s] commit %s failed, cause: %s' % (group, offsets, e))
+
+            def __iter__(self):
+                offsets = {}
+                timer = time.time()
+                for item in super(Receiver, self).__iter__():
+                    yield item
+                    if not is_event(item):
+                        offsets[item[0]] = item[1] + 1
+                    if group and offsets and (is_event(item) or time.time() - timer >= interval):
+                        self.commit(offsets)
+                        offsets = {}
+                        timer = time.time()
+
         class Mapper(Executor):
             def __init__(self, **kwargs):
                 super(Mapper, self).__init__(**kwargs)
-                self.file = None
-                self.position = None
+                self.partition = None
+                self.offset = None
 
             def handle(self, item):
-                if not item:
-                    return None
-                self.file, self.position, item = item.split('#', 2)
+                self.partition, self.offset, item = item
                 return item
 
         s = Receiver(self.address)
@@ -146,20 +235,81 @@ class Subscribe(Executor):
 
 
 class Sensor(TCPClient):
+    def __init__(self, address, batch=1000, batch_size=1024*1024, window=8):
+        TCPClient.__init__(self, address)
+        self.batch = batch
+        self.batch_size = batch_size
+        self.window = window
+        self.pending = 0
+        self.acks = ''
+        self.started = False
+        self.finished = False
+
     def handle_connect(self):
         self.send('1')
 
     def handle_read(self):
-        self.recv(3)
+        data = self.recv(65536)
+        if not self.started:
+            data = data.lstrip('\n')
+            self.started = bool(data)
+        self.acks += data
+        count = len(self.acks) / ACK.size
+        self.acks = self.acks[count * ACK.size:]
+        self.pending -= count
+        if self.finished and not self.pending and self.sent >= len(self.message):
+            self.handle_close()
+        elif count:
+            self.writing(True)
+
+    def encode(self):
+        parts = []
+        size = 0
+        while len(parts) < self.batch * 3 and size < self.batch_size:
+            try:
+                item = next(self.iterator)
+            except StopIteration:
+                self.finished = True
+                break
+            if is_event(item):
+                break
+            topic, data = item[0], ','.join(item[1:])
+            if isinstance(topic, unicode):
+                topic = topic.encode('utf-8')
+            if isinstance(data, unicode):
+                data = data.encode('utf-8')
+            parts.append(RECORD.pack(len(topic), len(data)))
+            parts.append(topic)
+            parts.append(data)
+            size += RECORD.size + len(topic) + len(data)
+        if not parts:
+            return ''
+        return BATCH.pack(size, len(parts) / 3) + ''.join(parts)
 
     def handle_write(self):
-        self.message = ','.join(self.message)
-        TCPClient.handle_write(self)
-
-
-class TCPServer(dispatcher):
-    def __init__(self, address, path, maxsize=1024*1024, listen_num=5, archive_size=1024*1024*1024):
-        dispatcher.__init__(self)
+        if self.sent >= len(self.message):
+            if self.finished or self.pending >= self.window:
+                if self.finished and not self.pending:
+                    self.handle_close()
+                self.writing(False)
+                return
+            self.message, self.sent = self.encode(), 0
+            if not self.message:
+                if not self.finished:
+                    self.pause(self.idle)
+                return
+            self.pending += 1
+        self.sent += self.send(buffer(self.message, self.sent))
+        if self.sent >= len(self.message):
+            logger.debug('OUTPUT socket a batch(%s)' % self.sent)
+
+
+class TCPServer(Dispatcher):
+    retain_interval = 60
+
+    def __init__(self, address, path, maxsize=1024*1024, listen_num=1024, archive_size=1024*1024*1024,
+                 retention_size=None, retention_time=None, partitions=1):
+        Dispatcher.__init__(self)
         socket_af = socket.AF_UNIX if isinstance(address, basestring) else socket.AF_INET
         self.create_socket(socket_af, socket.SOCK_STREAM)
         self.set_reuse_addr()
@@ -167,220 +317,448 @@ class TCPServer(dispatcher):
         self.listen(listen_num)
         self.size = maxsize
         self.archive_size = archive_size
+        self.retention_size = retention_size
+        self.retention_time = retention_time
+        self.partitions = partitions
         self.path = path
         self.data = {}
-        self.files = {}
+        self.logs = {}
+        self.sizes = {}
+        self.counter = {}
+        self.groups = {}
+        self.subscribers = {}
+        if retention_size or retention_time:
+            self.loop.call_later(self.retain_interval, self.retain)
+
+    def retain(self):
+        if not self.socket:
+            return
+        for logs in self.logs.values():
+            for log in logs:
+                log.retain()
+        self.loop.call_later(self.retain_interval, self.retain)
 
     def location(self, topic):
-        filenum, fp = self.files[topic]
-        path = os.path.join(self.path, topic)
-        items = self.data[topic]
-        filesize = os.path.getsize(os.path.join(path, str(filenum)))
-        size = 0
-        if filesize + sum([len(_) for _ in items]) > self.archive_size:
-            fp.close()
-            fp = open(os.path.join(path, str(filenum+1)), 'a')
-            self.files[topic] = [filenum+1, fp]
-        for item in items:
-            pos = fp.tell()
-            fp.write('%s#%s#%s\n' % (self.files[topic][0], pos, item))
-            size += fp.tell() - pos
-        self.data[topic] = []
-        logger.info('SUBSCRIBE topic [%s] location %s successfully' % (topic, size))
+        if not any(self.data[topic]):
+            return
+        for partition, items in enumerate(self.data[topic]):
+            if not items:
+                continue
+            log = self.logs[topic][partition]
+            log.append(items)
+            self.data[topic][partition] = []
+            logger.info('SUBSCRIBE topic [%s:%s] location %s successfully, offset: %s' %
+                        (topic, partition, len(items), log.end))
+        self.sizes[topic] = 0
+        for handler in list(self.subscribers.get(topic, ())):
+            handler.notify()
+
+    def subscribe(self, topic, handler):
+        self.subscribers.setdefault(topic, set()).add(handler)
+
+    def unsubscribe(self, topic, handler):
+        self.subscribers.get(topic, set()).discard(handler)
 
     def topic(self, name):
         if name in self.data:
             return self.data[name]
-        self.data[name] = []
         path = os.path.join(self.path, name)
-        if not os.path.exists(path):
-            os.makedirs(path)
-            open(os.path.join(path, '0'), 'w').close()
-        filenum = max([int(_) for _ in os.listdir(path)])
-        self.files[name] = (filenum, open(os.path.join(path, str(filenum)), 'a'))
+        partitions = self.partitions
+        if os.path.exists(path):
+            partitions = len([_ for _ in os.listdir(path) if _.isdigit()]) or partitions
+        self.data[name] = [[] for _ in range(partitions)]
+        self.logs[name] = [Log(os.path.join(path, str(_)), self.archive_size,
+                               retention_size=self.retention_size, retention_time=self.retention_time)
+                           for _ in range(partitions)]
+        self.sizes[name] = 0
+        self.counter[name] = 0
         return self.data[name]
 
-    def handle_accept(self):
-        pair = self.accept()
-        if pair is not None:
+    def append(self, topic, data):
+        partitions = self.topic(topic)
+        items = partitions[self.counter[topic] % len(partitions)]
+        self.counter[topic] += 1
+        items.append(data)
+        self.sizes[topic] += len(data)
+        return self.sizes[topic]
+
+    def group(self, name):
+        if name not in self.groups:
+            offsets = {}
+            filename = os.path.join(self.path, '.groups', '%s.json' % name)
+            if os.path.exists(filename):
+                with open(filename) as fp:
+                    for topic, value in json.load(fp).items():
+                        offsets[topic] = dict([(int(k), v) for k, v in value.items()])
+            self.groups[name] = {'offsets': offsets, 'members': {}}
+        return self.groups[name]
+
+    def join(self, name, topic, handler):
+        self.group(name)['members'].setdefault(topic, []).append(handler)
+        self.rebalance(name, topic)
+
+    def leave(self, name, topic, handler):
+        members = self.group(name)['members'].get(topic, [])
+        if handler in members:
+            members.remove(handler)
+            self.rebalance(name, topic)
+
+    def rebalance(self, name, topic):
+        members = self.group(name)['members'][topic]
+        for index, handler in enumerate(members):
+            handler.assign(range(index, len(self.logs[topic]), len(members)))
+        logger.info('SUBSCRIBE group [%s] topic [%s] rebalanced to %s members' % (name, topic, len(members)))
+
+    def committed(self, name, topic, partition):
+        if not name:
+            return None
+        return self.group(name)['offsets'].get(topic, {}).get(partition)
+
+    def commit(self, name, topic, offsets):
+        if not name or not offsets:
+            return
+        group = self.group(name)
+        group['offsets'].setdefault(topic, {}).update(offsets)
+        path = os.path.join(self.path, '.groups')
+        if not os.path.exists(path):
+            os.mkdir(path)
+        filename = os.path.join(path, '%s.json' % name)
+        with open(filename + '.tmp', 'w') as fp:
+            json.dump(group['offsets'], fp)
+        os.rename(filename + '.tmp', filename)
+
+    def handle_read(self):
+        while self.socket:
+            pair = self.accept()
+            if pair is None:
+                break
             sock, addr = pair
-            htype = None
             logger.info('server connect to %s(%s), pid: %s' % (addr, sock.fileno(), os.getpid()))
-            counter = 0
-            while not htype:
-                try:
-                    sock.send('\n')
-                    htype = sock.recv(1)
-                except socket.error:
-                    time.sleep(1)
-                    counter += 1
-                if counter > 5:
-                    break
-            logger.info('server connect to %s(%s), type: %s' % (addr, sock.fileno(), htype))
-            if htype == '0':
-                GetHandler(self, sock)
-            elif htype == '1':
-                PutHandler(self, sock)
-            elif htype == '2':
-                StaHandler(self, sock)
-            else:
-                sock.close()
+            Greeting(self, sock, addr)
 
-    def handle_error(self):
-        logger.error('server socket %s error' % str(self.addr))
+    def handle_error(self, e=None):
+        logger.error('server socket %s error: %s' % (str(self.addr), e))
         self.handle_close()
 
-    def handle_expt(self):
-        logger.error('server socket %s error: unhandled incoming priority event' % str(self.addr))
-
     def handle_close(self):
         logger.info('server socket %s close' % str(self.addr))
         self.close()
 
 
-class Handler(dispatcher):
-    def __init__(self, server, *args):
-        dispatcher.__init__(self, *args)
+class Greeting(Dispatcher):
+    timeout = 5
+
+    def __init__(self, server, sock, addr):
+        Dispatcher.__init__(self, sock, server.loop)
+        self.server = server
+        self.addr = addr
+        self.send('\n')
+        self.loop.call_later(self.timeout, self.expire)
+
+    def expire(self):
+        if self.socket:
+            logger.info('server connect to %s(%s) timeout' % (self.addr, self.fileno))
+            self.close()
+
+    def handle_read(self):
+        htype = self.recv(1)
+        if not htype:
+            return
+        logger.info('server connect to %s(%s), type: %s' % (self.addr, self.fileno, htype))
+        handler = {'0': GetHandler, '1': PutHandler, '2': StaHandler}.get(htype)
+        if handler:
+            handler(self.server, self.detach(), self.addr)
+        else:
+            self.close()
+
+
+class Handler(Dispatcher):
+    buffer_size = 4096
+
+    def __init__(self, server, sock, addr=None):
+        Dispatcher.__init__(self, sock, server.loop)
         self.server = server
-        self.message = ''
+        self.addr = addr
+        self.buffer = bytearray(self.buffer_size)
+        self.message = bytearray()
+        self.output = ''
 
     def handle_error(self, e=None):
         logger.error('server handler socket %s error: %s' % (str(self.addr), e))
         self.handle_close()
 
-    def handle_expt(self):
-        logger.error('server handler socket %s error: unhandled incoming priority event' % str(self.addr))
-
     def handle_close(self):
         logger.info('server(%s) socket %s close' % (self.__class__.__name__, self.addr))
         self.close()
 
-    def handle_read(self):
+    def receive(self):
+        view = memoryview(self.buffer)
         while True:
             try:
-                msg = self.recv(512)
-                if not msg:
-                    break
-                self.message += msg
+                size = self.socket.recv_into(self.buffer)
             except socket.error, e:
-                if e.errno == 35:
-                    break
-                else:
-                    raise
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return True
+                if e.errno in DISCONNECTED:
+                    return False
+                raise
+            if not size:
+                return False
+            self.message += view[:size]
+            if size < len(self.buffer):
+                return True
 
-        if '\n' not in self.message:
-            data = ''
-        else:
-            data, self.message = self.message.rsplit('\n', 1)
+    def handle_read(self):
+        alive = self.receive()
+        end = self.message.rfind('\n')
+        if end >= 0:
+            data = str(self.message[:end])
+            del self.message[:end + 1]
+            results = []
+            try:
+                for item in data.split('\n'):
+                    if item:
+                        result = self.handle(item)
+                        if result is not None:
+                            results.append(result + '\n')
+            except Exception, e:
+                self.handle_error(e)
+            self.write(''.join(results))
+        if not alive:
+            self.handle_close()
+
+    def write(self, data):
+        self.output += data
+        self.flush()
+
+    def flush(self):
+        if self.socket and self.output:
+            self.output = self.output[self.send(self.output):]
+            self.writing(bool(self.output))
+
+    def handle_write(self):
+        self.flush()
+
+
+class PutHandler(Handler):
+    buffer_size = 256*1024
 
+    def handle_read(self):
+        alive = self.receive()
+        acks = []
+        start = 0
         try:
-            for item in data.split('\n'):
-                if item:
-                    self.send(self.handle(item) + '\n')
+            while len(self.message) - start >= BATCH.size:
+                length, count = BATCH.unpack_from(self.message, start)
+                if len(self.message) - start - BATCH.size < length:
+                    break
+                start += BATCH.size
+                self.handle(str(self.message[start: start + length]))
+                start += length
+                acks.append(ACK.pack(count))
         except Exception, e:
             self.handle_error(e)
+        del self.message[:start]
+        self.write(''.join(acks))
+        if not alive:
+            self.handle_close()
 
-
-class PutHandler(Handler):
     def handle(self, data):
-        topic, data = data.split(',', 1)
-        self.server.topic(topic).append(data)
-        if sys.getsizeof(self.server.data[topic]) >= self.server.size:
-            self.server.location(topic)
-        return '200'
+        topics = set()
+        start = 0
+        while start < len(data):
+            size, length = RECORD.unpack_from(data, start)
+            start += RECORD.size
+            topic = data[start: start + size]
+            start += size
+            self.server.append(topic, data[start: start + length])
+            start += length
+            topics.add(topic)
+        for topic in topics:
+            if self.server.sizes[topic] >= self.server.size or self.server.subscribers.get(topic):
+                self.server.location(topic)
 
 
 class StaHandler(Handler):
     def topics(self):
         keys = self.server.data.keys()
         if os.path.exists(self.server.path):
-            keys += os.listdir(self.server.path)
+            keys += [_ for _ in os.listdir(self.server.path) if not _.startswith('.')]
         return json.dumps(list(set(keys)))
 
     def status(self, name):
         ret = {}
-        if os.path.exists(self.server.path):
-            filepath = os.path.join(self.server.path, name)
-            if os.path.exists(filepath):
-                files = os.listdir(filepath)
-                ret['filenum'] = len(files)
-                ret['filesize'] = sum([os.path.getsize(os.path.join(filepath, _)) for _ in files])
-            items = self.server.data.get(name, [])
-            ret['memsize'] = sum([len(_) for _ in items])
+        if name in self.server.logs or os.path.exists(os.path.join(self.server.path, name)):
+            self.server.topic(name)
+            logs = self.server.logs[name]
+            ret['filenum'] = sum([len(_.segments) for _ in logs])
+            ret['filesize'] = sum([_.size for _ in logs])
+            ret['memsize'] = self.server.sizes[name]
+            ret['partitions'] = [{'start': _.start, 'end': _.end} for _ in logs]
+        return json.dumps(ret)
+
+    def group(self, name):
+        ret = {}
+        group = self.server.group(name)
+        for topic in set(group['offsets'].keys() + group['members'].keys()):
+            self.server.topic(topic)
+            partitions = []
+            for partition, log in enumerate(self.server.logs[topic]):
+                end = log.end + len(self.server.data[topic][partition])
+                committed = group['offsets'].get(topic, {}).get(partition)
+                partitions.append({'committed': committed, 'end': end,
+                                   'lag': end - max(committed or 0, log.start)})
+            ret[topic] = {'members': len(group['members'].get(topic, [])),
+                          'lag': sum([_['lag'] for _ in partitions]),
+                          'partitions': partitions}
         return json.dumps(ret)
 
     def stop(self):
         for name in self.server.data:
             self.server.location(name)
+            for log in self.server.logs[name]:
+                log.close()
         self.server.close()
-        for handler in self._map.values():
+        for handler in self.loop.handlers.values():
             if isinstance(handler, PutHandler):
                 handler.close()
         return 'true'
 
     def handle(self, data):
-        data = data.strip().lower()
-        if data == 'topics':
+        command, _, name = data.strip().partition(' ')
+        command = command.lower()
+        if command == 'topics':
             return self.topics()
-        if data.startswith('topic '):
-            name = data[6:]
+        if command == 'topic':
             return self.status(name)
-        if data == 'stop':
+        if command == 'group':
+            return self.group(name)
+        if command == 'stop':
             return self.stop()
         return 'null'
 
 
 class GetHandler(Handler):
-    def __init__(self, server, *args):
-        Handler.__init__(self, server, *args)
+    def __init__(self, server, sock, addr=None):
+        Handler.__init__(self, server, sock, addr)
         self.topic = None
-        self.number = -1
-        self.blocksize = 0
+        self.group = None
         self.offset = 0
-        self.fp = None
+        self.partitions = []
+        self.cursors = {}
+        self.current = None
+        self.header = ''
+        self.last = -1
+        self.local = False
+        self.chunk_size = 16*1024*1024
 
     def handle(self, data):
         data = json.loads(data)
+        if 'commit' in data:
+            offsets = dict([(int(k), v) for k, v in data['commit'].items()])
+            self.server.commit(self.group, self.topic,
+                               dict([(k, v) for k, v in offsets.items() if k in self.partitions]))
+            return None
         self.topic = data['topic']
-        if data.get('number'):
-            self.use(data['number'])
-        if data.get('offset'):
-            self.offset = int(data['offset'])
-            self.fp.seek(self.offset)
-        return ''
-
-    def use(self, number):
-        self.number = int(number)
-        filename = os.path.join(self.server.path, self.topic, str(self.number))
-        if self.fp:
-            self.fp.close()
-        self.fp = open(filename)
-        self.blocksize = os.path.getsize(filename)
-        self.offset = 0
-
-    def handle_write(self):
-        from sendfile import sendfile
-        self.offset += sendfile(self.socket.fileno(), self.fp.fileno(), self.offset, self.blocksize)
+        self.group = data.get('group')
+        self.offset = data.get('offset', 0)
+        self.local = data.get('local', False)
+        self.server.topic(self.topic)
+        self.server.location(self.topic)
+        partitions = range(len(self.server.logs[self.topic]))
+        if self.group:
+            self.server.join(self.group, self.topic, self)
+        elif data.get('partition') is not None:
+            self.assign([_ for _ in partitions if _ == data['partition']])
+        else:
+            self.assign(partitions)
+        self.server.subscribe(self.topic, self)
+        self.notify()
+        return None
 
-    def writable(self):
-        if not self.topic:
-            return False
-        if self.fp and self.blocksize > self.offset:
+    def assign(self, partitions):
+        self.partitions = partitions
+        logs = self.server.logs[self.topic]
+        for partition in partitions:
+            if partition not in self.cursors:
+                offset = self.server.committed(self.group, self.topic, partition)
+                self.use(partition, *logs[partition].locate(self.offset if offset is None else offset))
+        for partition in self.cursors.keys():
+            if partition not in partitions and not (self.current and self.current[0] == partition):
+                self.release(partition)
+        self.notify()
+
+    def use(self, partition, segment, position):
+        self.cursors[partition] = [segment, position]
+
+    def release(self, partition):
+        self.cursors.pop(partition, None)
+
+    def notify(self):
+        self.writing(True)
+
+    def ready(self, partition):
+        segment, position = self.cursors[partition]
+        if segment.size > position:
             return True
-        if self.fp:
-            self.blocksize = endpoint(self.fp)
-            if self.blocksize > self.offset:
+        log = self.server.logs[self.topic][partition]
+        if segment not in log.segments:
+            self.use(partition, *log.locate(log.start))
+        else:
+            segment = log.next(segment)
+            if segment:
+                self.use(partition, segment, 0)
+            elif self.server.data[self.topic][partition]:
+                self.server.location(self.topic)
+            else:
+                return False
+        return self.ready(partition)
+
+    def chunk(self):
+        for partition in sorted(self.cursors, key=lambda x: x <= self.last):
+            if self.ready(partition):
+                segment, position = self.cursors[partition]
+                self.current = [partition, min(segment.size - position, self.chunk_size)]
+                if self.local:
+                    self.header = LOCAL.pack(partition, segment.base, position, self.current[1])
+                else:
+                    self.header = CHUNK.pack(*self.current)
                 return True
+        return False
 
-        pathname = os.path.join(self.server.path, str(self.topic))
-        if os.path.exists(pathname):
-            nums = sorted([int(_) for _ in os.listdir(pathname) if int(_) > self.number])
-        else:
-            nums = []
+    def handle_write(self):
+        while self.socket:
+            if not self.current and not self.chunk():
+                self.writing(False)
+                return
+            if self.header:
+                self.header = self.header[self.send(self.header):]
+                if self.header:
+                    return
+            partition, remaining = self.current
+            cursor = self.cursors[partition]
+            if self.local:
+                sent = remaining
+            else:
+                try:
+                    sent = sendfile(self.fileno, cursor[0].open_reader().fileno(), cursor[1], remaining)
+                except OSError, e:
+                    if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        return
+                    raise
+            cursor[1] += sent
+            self.current[1] -= sent
+            if self.current[1]:
+                return
+            self.current = None
+            self.last = partition
+            if partition not in self.partitions:
+                self.release(partition)
 
-        if nums:
-            self.use(nums[0])
-            return True
-        if self.topic in self.server.data and self.server.data[self.topic]:
-            self.server.location(self.topic)
-        return False
+    def handle_close(self):
+        self.cursors = {}
+        self.server.unsubscribe(self.topic, self)
+        if self.group:
+            self.server.leave(self.group, self.topic, self)
+            self.group = None
+        Handler.handle_close(self)
@@ -24,6 +24,15 @@ class Output(Executor):
             logger.error('OUTPUT %s %s error: %s' % (self.__class__.__name__, self.name, e))
             return {'data': item, 'exception': e, 'traceback': traceback.format_exc()}
 
+    def handle_batch(self, items):
+        try:
+            self.outputmany(items)
+        except IterableError, e:
+            return [_ for _ in e.args]
+        except Exception, e:
+            logger.error('OUTPUT %s %s error: %s' % (self.__class__.__name__, self.name, e))
+            return [{'data': _, 'exception': e, 'traceback': traceback.format_exc()} for _ in items]
+
     def output(self, item):
         pass
 
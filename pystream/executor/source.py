@@ -5,12 +5,18 @@ import os
 import sys
 import csv
 import time
+import errno
 import glob
+import select
 import logging
+from itertools import chain
+from fnmatch import fnmatch
+from collections import deque
 
 from executor import Executor
 from event import Event, is_event
-from utils import ifilter, endpoint
+from utils import ifilter, endpoint, Checkpoint
+from inotify import INotify, IN_MODIFY, IN_CREATE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO
 
 __author__ = 'tong'
 
@@ -22,7 +28,8 @@ def sleep(delta):
 
 
 class Tail(Executor):
-    def __init__(self, path, wait=1, times=3, startline=None, position=None, **kwargs):
+    def __init__(self, path, wait=1, times=3, startline=None, position=None, notify=True,
+                 checkpoint=None, checkpoint_interval=5, checkpoint_lines=None, **kwargs):
         super(Tail, self).__init__(**kwargs)
         path = os.path.abspath(path)
         if not os.path.exists(path):
@@ -35,17 +42,32 @@ class Tail(Executor):
         self.lineno = 0
         self.wait = wait
         self.times = times
+        self.notify = notify
         self.startline = startline or 0
         self.position = position or 0
+        self.inode = None
+        self.rotating = None
+        self.checkpoint = None
+        if checkpoint:
+            self.checkpoint = Checkpoint(checkpoint, checkpoint_interval, checkpoint_lines)
 
     def open(self, filename):
         if self.stream and not self.stream.closed:
             self.stream.close()
+        if self.checkpoint and self.inode:
+            self.checkpoint.remove(self.path, self.inode)
         self.stream = open(filename)
+        self.inode = os.fstat(self.stream.fileno()).st_ino
         self.pos = self.stream.tell()
         self.lineno = 0
+        self.rotating = None
 
     def seek(self):
+        if self.checkpoint:
+            lineno = self.checkpoint.resume(self.path, self.stream)
+            if lineno is not None:
+                self.lineno = lineno
+                return
         if self.position > 0:
             self.stream.seek(self.position)
             return
@@ -59,6 +81,83 @@ class Tail(Executor):
             self.stream.seek(0, 2)
 
     def __iter__(self):
+        notifier = self.notifier() if self.notify else None
+        if not notifier:
+            for item in self.poll():
+                yield item
+            return
+        try:
+            for item in self.watch(notifier):
+                yield item
+        finally:
+            notifier.close()
+
+    def notifier(self):
+        notifier = None
+        try:
+            notifier = INotify()
+            notifier.watch(os.path.dirname(self.path),
+                           IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO)
+            return notifier
+        except Exception, e:
+            if notifier:
+                notifier.close()
+            logger.info('SOURCE LOG inotify unavailable, fall back to polling: %s' % e)
+
+    def watch(self, notifier):
+        for event in self.catch():
+            yield event
+        self.seek()
+        while True:
+            self.pos = self.stream.tell()
+            line = self.stream.readline()
+            if line:
+                self.lineno += 1
+                yield line
+                if self.checkpoint and self.checkpoint.due():
+                    self.checkpoint.commit(self.path, self.inode, self.pos + len(line), self.lineno)
+                continue
+            if self.drained():
+                logger.info('SOURCE LOG redirect to %s (line count: %s)' % (self.path, self.lineno))
+                self.open(self.path)
+                continue
+            if self.checkpoint and self.checkpoint.count:
+                self.checkpoint.commit(self.path, self.inode, self.pos, self.lineno)
+            yield Event.IDLE
+            self.listen(notifier)
+            if os.fstat(self.stream.fileno()).st_size < self.pos:
+                logger.info('SOURCE LOG %s truncated (line count: %s)' % (self.path, self.lineno))
+                self.pos = 0
+                self.lineno = 0
+            self.stream.seek(self.pos)
+
+    def listen(self, notifier):
+        name = os.path.basename(self.path)
+        deadline = time.time() + self.wait
+        while True:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return
+            for _, mask, cookie, filename in notifier.read(timeout):
+                if filename == name:
+                    return
+
+    def rotated(self):
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except OSError:
+            return False
+
+    def drained(self):
+        if not self.rotated():
+            self.rotating = None
+            return False
+        if not self.rotating or self.rotating[1] != self.pos:
+            self.rotating = (time.time(), self.pos)
+            return False
+        return time.time() - self.rotating[0] >= self.wait * self.times
+
+    def poll(self):
         import psutil
         self.process = psutil.Process()
         for event in self.catch():
@@ -73,6 +172,8 @@ class Tail(Executor):
                     for event in self.redirect():
                         yield event
                     continue
+                if self.checkpoint and self.checkpoint.count:
+                    self.checkpoint.commit(self.path, self.inode, self.pos, self.lineno)
                 timer = time.time()
                 yield Event.IDLE
                 sleep(self.wait - (time.time() - timer))
@@ -81,6 +182,8 @@ class Tail(Executor):
                 self.count = 0
                 self.lineno += 1
                 yield line
+                if self.checkpoint and self.checkpoint.due():
+                    self.checkpoint.commit(self.path, self.inode, self.pos + len(line), self.lineno)
 
     def redirect(self):
         self.count = 0
@@ -114,22 +217,174 @@ class Tail(Executor):
             sleep(self.wait - (time.time() - timer))
 
 
+class MultiTail(Executor):
+    def __init__(self, pattern, wait=1, scan=10, batch=100, startline=None, position=None, notify=True,
+                 checkpoint=None, checkpoint_interval=5, checkpoint_lines=None, **kwargs):
+        super(MultiTail, self).__init__(**kwargs)
+        self.pattern = os.path.abspath(pattern)
+        self.wait = wait
+        self.scan = scan
+        self.batch = batch
+        self.startline = startline
+        self.position = position
+        self.notify = notify
+        self.files = {}
+        self.ready = deque()
+        self.rotating = set()
+        self.notifier = None
+        self.watches = set()
+        self.timer = 0
+        self.checkpoint = None
+        if checkpoint:
+            self.checkpoint = Checkpoint(checkpoint, checkpoint_interval, checkpoint_lines)
+
+    def add(self, path, initial=False):
+        try:
+            tail = Tail(path, wait=self.wait, startline=self.startline if initial else None,
+                        position=self.position if initial else None, notify=False)
+            tail.checkpoint = self.checkpoint
+            tail.open(path)
+            tail.seek()
+        except Exception, e:
+            logger.error('SOURCE MULTITAIL open %s failed, cause: %s' % (path, e))
+            return
+        logger.info('SOURCE MULTITAIL follow %s' % path)
+        self.files[path] = tail
+        self.ready.append(path)
+        dirname = os.path.dirname(path)
+        if self.notifier and dirname not in self.watches:
+            self.notifier.watch(dirname, IN_MODIFY | IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO)
+            self.watches.add(dirname)
+
+    def remove(self, path):
+        tail = self.files.pop(path)
+        logger.info('SOURCE MULTITAIL %s removed (line count: %s)' % (path, tail.lineno))
+        tail.stream.close()
+        if self.checkpoint:
+            self.checkpoint.remove(path, tail.inode)
+
+    def discover(self, initial=False):
+        self.timer = time.time()
+        for path in sorted(glob.glob(self.pattern)):
+            if path not in self.files and os.path.isfile(path):
+                self.add(path, initial)
+
+    def commit(self):
+        for path, tail in self.files.items():
+            self.checkpoint.update(path, tail.inode, tail.stream.tell(), tail.lineno)
+        self.checkpoint.save()
+
+    def listen(self):
+        deadline = time.time() + self.wait
+        while True:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                return
+            events = self.notifier.read(timeout)
+            for dirname, mask, cookie, name in events:
+                path = os.path.join(dirname, name)
+                if path in self.files:
+                    if path not in self.ready:
+                        self.ready.append(path)
+                elif mask & (IN_CREATE | IN_MOVED_TO) and fnmatch(path, self.pattern):
+                    self.add(path)
+            if self.ready:
+                return
+
+    def follow(self, path):
+        tail = self.files[path]
+        for _ in xrange(self.batch):
+            tail.pos = tail.stream.tell()
+            line = tail.stream.readline()
+            if not line:
+                break
+            tail.lineno += 1
+            yield path, line
+            if self.checkpoint and self.checkpoint.due():
+                self.commit()
+        else:
+            self.ready.append(path)
+            return
+        if tail.drained():
+            logger.info('SOURCE MULTITAIL redirect to %s (line count: %s)' % (path, tail.lineno))
+            tail.open(path)
+            self.ready.append(path)
+        elif tail.rotating:
+            self.rotating.add(path)
+            tail.stream.seek(tail.pos)
+        elif not os.path.exists(path):
+            self.remove(path)
+        else:
+            tail.stream.seek(tail.pos)
+
+    def __iter__(self):
+        if self.notify:
+            try:
+                self.notifier = INotify()
+            except Exception, e:
+                logger.info('SOURCE MULTITAIL inotify unavailable, fall back to polling: %s' % e)
+        try:
+            self.discover(True)
+            while True:
+                while self.ready:
+                    for item in self.follow(self.ready.popleft()):
+                        yield item
+                if self.checkpoint and self.checkpoint.count:
+                    self.commit()
+                timer = time.time()
+                yield Event.IDLE
+                if self.notifier:
+                    self.listen()
+                else:
+                    sleep(self.wait - (time.time() - timer))
+                    self.ready.extend(self.files)
+                self.ready.extend([_ for _ in self.rotating if _ in self.files and _ not in self.ready])
+                self.rotating.clear()
+                if time.time() - self.timer >= self.scan:
+                    self.discover()
+        finally:
+            if self.notifier:
+                self.notifier.close()
+                self.notifier = None
+            self.watches.clear()
+            for tail in self.files.values():
+                tail.stream.close()
+            self.files.clear()
+            self.ready.clear()
+            self.rotating.clear()
+
+
 class File(Executor):
     def __init__(self, path, filewait=None, confirmwait=None, cachefile=None,
-                 position=None, startline=None, **kwargs):
+                 position=None, startline=None, buffersize=1024*1024,
+                 checkpoint=None, checkpoint_interval=5, checkpoint_lines=None, **kwargs):
         super(File, self).__init__(**kwargs)
         self.path = os.path.abspath(path)
         self.filename = None
         self.file_wait = filewait
         self.confirm_wait = confirmwait
+        self.buffersize = buffersize
         self.lineno = 0
+        self.start = 0
+        self.pos = 0
+        self.chunk = []
+        self.chunkline = 0
         self.filter = ifilter('bloom', cachefile)
         self.position = position or 0
         self.startline = startline or 0
         self.stream = None
+        self.inode = None
+        self.checkpoint = None
+        if checkpoint:
+            self.checkpoint = Checkpoint(checkpoint, checkpoint_interval, checkpoint_lines)
         logger.info('SOURCE FILE FILTER: %s: %s' % (self.path, cachefile))
 
     def seek(self):
+        if self.checkpoint:
+            lineno = self.checkpoint.resume(self.filename, self.stream)
+            if lineno is not None:
+                self.lineno = lineno
+                return
         if self.position > 0:
             self.stream.seek(self.position)
             return
@@ -145,23 +400,63 @@ class File(Executor):
     def open(self, filename):
         self.filename = filename
         logger.info('SOURCE FILE dumping %s' % filename)
+        self.lineno = 0
         try:
             self.stream = open(filename)
+            self.inode = os.fstat(self.stream.fileno()).st_ino
             return self.stream
         except Exception, e:
             logger.error('SOURCE FILE open %s failed, cause: %s' % (filename, e))
         return None
 
     def fetch(self, fp):
+        if self.confirm_wait:
+            return self.follow(fp)
+        return self.buffered(fp)
+
+    def chunks(self, fp):
+        self.pos = fp.tell()
+        self.chunkline = 0
+        try:
+            while True:
+                lines = fp.readlines(self.buffersize)
+                if not lines:
+                    break
+                if lines[-1][-1] != '\n':
+                    lines.pop()
+                self.chunk = lines
+                yield lines
+                self.pos += sum(map(len, lines))
+                self.chunkline += len(lines)
+                self.chunk = []
+        finally:
+            fp.close()
+
+    def buffered(self, fp):
+        self.start = self.lineno
+        for lines in self.chunks(fp):
+            for line in lines:
+                self.lineno += 1
+                yield line
+
+    @property
+    def consumed(self):
+        return self.lineno - self.start
+
+    @property
+    def offset(self):
+        return self.pos + sum(map(len, self.chunk[:self.consumed-self.chunkline]))
+
+    def follow(self, fp):
         endpos = -1
-        self.lineno = 0
 
         while True:
-            pos = fp.tell()
-            fp.seek(pos)
+            self.pos = fp.tell()
+            fp.seek(self.pos)
             for line in fp:
                 if line[-1] == '\n':
                     self.lineno += 1
+                    self.pos += len(line)
                     yield line
                 else:
                     endpos = fp.tell()
@@ -194,14 +489,15 @@ class File(Executor):
 
             logger.info('SOURCE FILE new file %s' % files)
             for filename in sorted(files):
-                self.open(filename)
-                self.seek()
-                if not self.stream:
+                if not self.open(filename):
                     continue
+                self.seek()
 
                 try:
                     for line in self.fetch(self.stream):
                         yield line
+                        if self.checkpoint and self.checkpoint.due():
+                            self.checkpoint.commit(filename, self.inode, self.offset, self.lineno)
                 except Exception, e:
                     logger.error('SOURCE FILE dumping %s failed, cause: %s' % (filename, e))
                     try:
@@ -214,6 +510,8 @@ class File(Executor):
                 if self.stream and not self.stream.closed:
                     self.stream.close()
                 self.filter.add(filename)
+                if self.checkpoint:
+                    self.checkpoint.remove(filename, self.inode)
                 logger.info('SOURCE FILE dumping %s End %s' % (filename, self.lineno))
 
 
@@ -233,15 +531,28 @@ class Csv(File):
     def __init__(self, path, filewait=None, confirmwait=None, cachefile=None, name=None, ignore_exc=True, **kwargs):
         super(Csv, self).__init__(path, filewait, confirmwait, cachefile,
                                   name=name, ignore_exc=ignore_exc, **kwargs)
+        self.reader = None
+
+    @property
+    def consumed(self):
+        return self.reader.line_num
 
     def fetch(self, fp):
-        reader = csv.reader(fp, **self.kwargs)
-        for line in reader:
-            self.lineno += 1
+        lineno = self.lineno
+        if self.confirm_wait:
+            lines = (_ for _ in self.follow(fp) if not is_event(_))
+        else:
+            lines = chain.from_iterable(self.chunks(fp))
+        self.reader = csv.reader(lines, **self.kwargs)
+        for line in self.reader:
+            lineno += 1
+            self.lineno = lineno
             yield line
 
 
 class TCPClient(Executor):
+    buffer_size = 1024
+
     def __init__(self, address, **kwargs):
         super(TCPClient, self).__init__(**kwargs)
         self.address = address
@@ -262,12 +573,12 @@ class TCPClient(Executor):
     def read(self, sock):
         import socket
         try:
-            msg = sock.recv(1024)
+            msg = sock.recv(self.buffer_size)
             if not msg:
                 return None
             return msg
         except socket.error, e:
-            if e.errno == 35:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
                 return Event.IDLE
             else:
                 raise Exception('socket %s(%s) error' % (self.address, sock.fileno()))
@@ -284,20 +595,23 @@ class TCPClient(Executor):
     def __iter__(self):
         sock = self.initialize()
         message = ''
-        while True:
-            data = self.read(sock)
-            if data is None and not message:
-                break
-            if is_event(data):
-                yield data
-                if not message:
-                    time.sleep(1)
-                    continue
-            else:
-                message += data
-            message, items = self.handle(message)
-            for item in items:
-                yield item
+        try:
+            while True:
+                data = self.read(sock)
+                if data is None and not message:
+                    break
+                if is_event(data):
+                    yield data
+                    if not message:
+                        select.select([sock], [], [], 1)
+                        continue
+                else:
+                    message += data
+                message, items = self.handle(message)
+                for item in items:
+                    yield item
+        finally:
+            sock.close()
 
 
 class Kafka(Executor):
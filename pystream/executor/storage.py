@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import time
+import zlib
+import bisect
+import struct
+import logging
+
+__author__ = 'tong'
+
+logger = logging.getLogger('stream.logger')
+
+HEADER = struct.Struct('>QII')
+INDEX = struct.Struct('>QQ')
+
+
+def encode(offset, data):
+    return HEADER.pack(offset, len(data), zlib.crc32(data) & 0xffffffff) + data
+
+
+def decode(buf, start=0, end=None):
+    records = []
+    size = len(buf) if end is None else end
+    while start + HEADER.size <= size:
+        offset, length, crc = HEADER.unpack_from(buf, start)
+        end = start + HEADER.size + length
+        if end > size:
+            break
+        records.append((offset, buf[start + HEADER.size: end]))
+        start = end
+    return records, start
+
+
+class Segment(object):
+    def __init__(self, path, base, index_interval=4096):
+        self.base = base
+        self.filename = os.path.join(path, '%020d.log' % base)
+        self.indexname = os.path.join(path, '%020d.index' % base)
+        self.index_interval = index_interval
+        self.index = []
+        self.next = base
+        self.size = 0
+        self.indexed = 0
+        self.fp = None
+        self.ifp = None
+        self._reader = None
+        if os.path.exists(self.indexname):
+            with open(self.indexname, 'rb') as fp:
+                data = fp.read()
+            self.index = [INDEX.unpack_from(data, i) for i in range(0, len(data) - len(data) % INDEX.size, INDEX.size)]
+        self.recover()
+
+    def recover(self):
+        if not os.path.exists(self.filename):
+            open(self.filename, 'wb').close()
+        filesize = os.path.getsize(self.filename)
+        count = len(self.index)
+        while True:
+            while self.index and self.index[-1][1] >= filesize:
+                self.index.pop()
+            position = self.index[-1][1] if self.index else 0
+            with open(self.filename, 'rb') as fp:
+                fp.seek(position)
+                data = fp.read()
+            start = 0
+            while start + HEADER.size <= len(data):
+                offset, length, crc = HEADER.unpack_from(data, start)
+                payload = data[start + HEADER.size: start + HEADER.size + length]
+                if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+                    break
+                start += HEADER.size + length
+                self.next = offset + 1
+            if start or not self.index:
+                break
+            self.index.pop()
+        self.size = position + start
+        if self.size != filesize:
+            logger.warn('SEGMENT %s truncated to %s bytes' % (self.filename, self.size))
+            with open(self.filename, 'r+b') as fp:
+                fp.truncate(self.size)
+        if len(self.index) != count:
+            logger.warn('SEGMENT %s dropped %s stale index entries' % (self.indexname, count - len(self.index)))
+            with open(self.indexname, 'wb') as fp:
+                fp.write(''.join([INDEX.pack(*_) for _ in self.index]))
+        self.indexed = position
+
+    def open_reader(self):
+        if not self._reader:
+            self._reader = open(self.filename, 'rb')
+        return self._reader
+
+    @property
+    def mtime(self):
+        return os.path.getmtime(self.filename)
+
+    def append(self, items, offset):
+        if not self.fp:
+            self.fp = open(self.filename, 'ab')
+            self.ifp = open(self.indexname, 'ab')
+        buf = []
+        position = self.size
+        for item in items:
+            if position - self.indexed >= self.index_interval:
+                self.index.append((offset, position))
+                self.ifp.write(INDEX.pack(offset, position))
+                self.indexed = position
+            record = encode(offset, item)
+            buf.append(record)
+            position += len(record)
+            offset += 1
+        self.fp.write(''.join(buf))
+        self.fp.flush()
+        self.ifp.flush()
+        self.size = position
+        self.next = offset
+        return offset
+
+    def lookup(self, offset):
+        if offset <= self.base:
+            return 0
+        if offset >= self.next:
+            return self.size
+        i = bisect.bisect_right(self.index, (offset, float('inf'))) - 1
+        position = self.index[i][1] if i >= 0 else 0
+        with open(self.filename, 'rb') as fp:
+            fp.seek(position)
+            while position < self.size:
+                current, length, crc = HEADER.unpack(fp.read(HEADER.size))
+                if current >= offset:
+                    break
+                position += HEADER.size + length
+                fp.seek(position)
+        return position
+
+    def close(self):
+        self.release()
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+    def release(self):
+        if self.fp:
+            self.fp.close()
+            self.ifp.close()
+            self.fp = self.ifp = None
+
+    def remove(self):
+        # an open reader keeps serving the unlinked file until its subscriber moves on
+        self.release()
+        for filename in (self.filename, self.indexname):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+
+class Log(object):
+    def __init__(self, path, segment_size=1024*1024*1024, index_interval=4096,
+                 retention_size=None, retention_time=None):
+        self.path = path
+        self.segment_size = segment_size
+        self.index_interval = index_interval
+        self.retention_size = retention_size
+        self.retention_time = retention_time
+        if not os.path.exists(path):
+            os.makedirs(path)
+        bases = sorted([int(_[:-4]) for _ in os.listdir(path) if _.endswith('.log')])
+        self.segments = [Segment(path, base, index_interval) for base in bases or [0]]
+
+    @property
+    def start(self):
+        return self.segments[0].base
+
+    @property
+    def end(self):
+        return self.segments[-1].next
+
+    @property
+    def size(self):
+        return sum([_.size for _ in self.segments])
+
+    def append(self, items):
+        segment = self.segments[-1]
+        if segment.size >= self.segment_size and segment.next > segment.base:
+            segment.close()
+            segment = Segment(self.path, segment.next, self.index_interval)
+            self.segments.append(segment)
+            self.retain()
+        return segment.append(items, segment.next)
+
+    def retain(self):
+        while len(self.segments) > 1:
+            segment = self.segments[0]
+            if self.retention_size and self.size > self.retention_size:
+                pass
+            elif self.retention_time and time.time() - segment.mtime > self.retention_time:
+                pass
+            else:
+                break
+            logger.info('LOG %s remove segment %s' % (self.path, segment.base))
+            self.segments.pop(0).remove()
+
+    def segment(self, offset):
+        i = bisect.bisect_right([_.base for _ in self.segments], offset) - 1
+        return self.segments[max(i, 0)]
+
+    def locate(self, offset):
+        if offset is None or offset < 0:
+            offset = self.end
+        offset = max(offset, self.start)
+        segment = self.segment(offset)
+        return segment, segment.lookup(offset)
+
+    def next(self, segment):
+        i = bisect.bisect_right([_.base for _ in self.segments], segment.base)
+        if i < len(self.segments):
+            return self.segments[i]
+        return None
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+class Reader(object):
+    def __init__(self, path):
+        self.path = path
+        self.base = None
+        self.map = None
+
+    def read(self, base, start, end):
+        if self.base != base or len(self.map) < end:
+            self.close()
+            with open(os.path.join(self.path, '%020d.log' % base), 'rb') as fp:
+                self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self.base = base
+        return decode(self.map, start, end)
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.base = self.map = None
@@ -2,7 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import os
+import mmap
+import math
 import time
+import json
+import heapq
+import struct
+import cPickle
+import hashlib
+import calendar
+import datetime
+import tempfile
 import multiprocessing
 
 __author__ = 'tong'
@@ -58,6 +68,108 @@ class Window(object):
         return time.time() - self.timer >= self.timeout
 
 
+def epoch(value):
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1000000.0
+    return value
+
+
+class Tumbling(object):
+    merging = False
+
+    def __init__(self, size):
+        self.size = size
+
+    def assign(self, timestamp):
+        start = timestamp - timestamp % self.size
+        return [(start, start + self.size)]
+
+
+class Sliding(object):
+    merging = False
+
+    def __init__(self, size, slide):
+        self.size = size
+        self.slide = slide
+
+    def assign(self, timestamp):
+        windows = []
+        start = timestamp - timestamp % self.slide
+        while start > timestamp - self.size:
+            windows.append((start, start + self.size))
+            start -= self.slide
+        return windows
+
+
+class Session(object):
+    merging = True
+
+    def __init__(self, gap):
+        self.gap = gap
+
+    def assign(self, timestamp):
+        return [(timestamp, timestamp + self.gap)]
+
+
+class Reverse(object):
+    __slots__ = ('value', )
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def merge(iterables, key=None, desc=False):
+    key = key or (lambda x: x)
+    wrap = Reverse if desc else (lambda x: x)
+    heap = []
+    for index, iterable in enumerate(iterables):
+        iterator = iter(iterable)
+        for item in iterator:
+            heap.append([wrap(key(item)), index, item, iterator])
+            break
+    heapq.heapify(heap)
+    while heap:
+        entry = heap[0]
+        yield entry[2]
+        for item in entry[3]:
+            entry[0] = wrap(key(item))
+            entry[2] = item
+            heapq.heapreplace(heap, entry)
+            break
+        else:
+            heapq.heappop(heap)
+
+
+def dump(items, path):
+    fd, filename = tempfile.mkstemp(dir=path)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            pickler = cPickle.Pickler(fp, cPickle.HIGHEST_PROTOCOL)
+            for item in items:
+                pickler.dump(item)
+                pickler.clear_memo()
+    except BaseException:
+        os.remove(filename)
+        raise
+    return filename
+
+
+def load(filename):
+    with open(filename, 'rb') as fp:
+        unpickler = cPickle.Unpickler(fp)
+        while True:
+            try:
+                yield unpickler.load()
+            except EOFError:
+                return
+
+
 def ifilter(name, path, **kwargs):
     if name == 'bloom':
         return BloomFilter(path, **kwargs)
@@ -85,6 +197,56 @@ def ungzip(item):
     return s.getvalue()
 
 
+class Checkpoint(object):
+    def __init__(self, cachefile, interval=5, lines=None):
+        self.cachefile = cachefile
+        self.interval = interval
+        self.lines = lines
+        self.timer = time.time()
+        self.count = 0
+        self.offsets = {}
+        if os.path.exists(self.cachefile):
+            with open(self.cachefile) as fp:
+                self.offsets = json.load(fp)
+
+    @staticmethod
+    def key(path, inode):
+        return '%s#%s' % (path, inode)
+
+    def resume(self, path, fp):
+        stat = os.fstat(fp.fileno())
+        offset, lineno = self.offsets.get(self.key(path, stat.st_ino), (0, 0))
+        if not offset or offset > stat.st_size:
+            return None
+        fp.seek(offset)
+        return lineno
+
+    def due(self):
+        self.count += 1
+        if self.lines and self.count >= self.lines:
+            return True
+        return bool(self.interval) and time.time() - self.timer >= self.interval
+
+    def update(self, path, inode, offset, lineno):
+        self.offsets[self.key(path, inode)] = (offset, lineno)
+
+    def commit(self, path, inode, offset, lineno):
+        self.update(path, inode, offset, lineno)
+        self.save()
+
+    def remove(self, path, inode):
+        if self.offsets.pop(self.key(path, inode), None):
+            self.save()
+
+    def save(self):
+        self.count = 0
+        self.timer = time.time()
+        filename = '%s.tmp' % self.cachefile
+        with open(filename, 'w') as fp:
+            json.dump(self.offsets, fp)
+        os.rename(filename, self.cachefile)
+
+
 class IterableError(Exception):
     pass
 
@@ -92,26 +254,29 @@ class IterableError(Exception):
 class BloomFilter(object):
     def __init__(self, cachefile, capacity=1000000, error_rate=0.001):
         self.cachefile = cachefile
-        if os.name == 'nt' or not cachefile:
-            from pybloom import BloomFilter
-            if self.cache():
-                with open(cachefile, 'r') as fp:
-                    self.filter = BloomFilter.fromfile(fp)
-            else:
-                self.filter = BloomFilter(capacity=capacity, error_rate=error_rate)
-        elif os.name == 'posix':
-            from pybloomfilter import BloomFilter
-            if self.cache():
-                self.filter = BloomFilter.open(self.cachefile)
-            else:
-                self.filter = BloomFilter(capacity, error_rate, cachefile)
+        try:
+            if os.name == 'nt' or not cachefile:
+                from pybloom import BloomFilter
+                if self.cache():
+                    with open(cachefile, 'r') as fp:
+                        self.filter = BloomFilter.fromfile(fp)
+                else:
+                    self.filter = BloomFilter(capacity=capacity, error_rate=error_rate)
+            elif os.name == 'posix':
+                from pybloomfilter import BloomFilter
+                if self.cache():
+                    self.filter = BloomFilter.open(self.cachefile)
+                else:
+                    self.filter = BloomFilter(capacity, error_rate, cachefile)
+        except ImportError:
+            self.filter = BitBloom(cachefile, capacity, error_rate)
 
     def __contains__(self, key):
         return key in self.filter
 
     def add(self, obj):
         self.filter.add(obj)
-        if os.name == 'nt':
+        if os.name == 'nt' and self.cachefile and not isinstance(self.filter, BitBloom):
             with open(self.cachefile, 'w') as fp:
                 self.filter.tofile(fp)
 
@@ -119,6 +284,44 @@ class BloomFilter(object):
         return os.path.exists(self.cachefile or '')
 
 
+class BitBloom(object):
+    header = struct.Struct('<QQ')
+
+    def __init__(self, cachefile=None, capacity=1000000, error_rate=0.001):
+        if cachefile and os.path.exists(cachefile):
+            with open(cachefile, 'r+b') as fp:
+                self.bits, self.hashes = self.header.unpack(fp.read(self.header.size))
+                self.data = mmap.mmap(fp.fileno(), 0)
+            return
+        self.bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits * math.log(2) / capacity)))
+        size = self.header.size + (self.bits + 7) / 8
+        if cachefile:
+            with open(cachefile, 'w+b') as fp:
+                fp.truncate(size)
+                self.data = mmap.mmap(fp.fileno(), size)
+        else:
+            self.data = mmap.mmap(-1, size)
+        self.data[:self.header.size] = self.header.pack(self.bits, self.hashes)
+
+    def positions(self, key):
+        a, b = struct.unpack('<QQ', hashlib.md5(key).digest())
+        return [self.header.size * 8 + (a + i * b) % self.bits for i in xrange(self.hashes)]
+
+    def __contains__(self, key):
+        data = self.data
+        for position in self.positions(key):
+            if not ord(data[position >> 3]) & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        data = self.data
+        for position in self.positions(key):
+            index = position >> 3
+            data[index] = chr(ord(data[index]) | (1 << (position & 7)))
+
+
 class MaxFilter(object):
     def __init__(self, cachefile, is_number=False):
         self.cachefile = cachefile
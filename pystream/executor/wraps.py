@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import Queue
 import logging
 import traceback
+import multiprocessing
+from collections import deque
 
 from output import Output
 from executor import Executor
-from event import Event, is_event
-from utils import start_process, IterableError
+from event import Event, Chunk, is_event, is_chunk
+from utils import Window, start_process, IterableError
 
 
 __author__ = 'tong'
@@ -33,9 +36,15 @@ class Batch(Wraps):
             if is_event(items) and self._output:
                 yield items
                 continue
+            if is_chunk(items):
+                items = [_ for errors in items for _ in errors]
             for item in items:
                 yield item
 
+    def handle_batch(self, items):
+        result = self.handle(items)
+        return [result] if result else None
+
     def handle(self, item):
         try:
             self.sender.outputmany(item)
@@ -93,3 +102,106 @@ class Daemonic(Wraps):
         else:
             return start_process(self._run)
 
+
+_parallel = None
+
+
+def _parallel_initialize(exe):
+    global _parallel
+    head = exe
+    while head._source:
+        head = head._source
+    _parallel = (exe, head)
+
+
+def _parallel_handle(items):
+    exe, head = _parallel
+    try:
+        head._source = [Chunk(items)]
+        return True, list(exe)
+    except BaseException, e:
+        return False, e
+    finally:
+        head._source = None
+
+
+class Parallel(Wraps):
+    def __init__(self, exe, workers=None, ordered=True, chunksize=1000, timeout=None, **kwargs):
+        super(Parallel, self).__init__(**kwargs)
+        self.exe = exe
+        self.workers = workers or multiprocessing.cpu_count()
+        self.ordered = ordered
+        self.window = Window(chunksize, timeout)
+        self.pending = deque()
+        self.done = Queue.Queue()
+        self.counter = 0
+        self.batched = False
+
+    def __or__(self, executor):
+        return Executor.__or__(self, executor)
+
+    def __iter__(self):
+        pool = multiprocessing.Pool(self.workers, _parallel_initialize, (self.exe, ))
+        finished = False
+        try:
+            for item in self.source:
+                if is_event(item):
+                    for result in self.flush(pool, 0):
+                        yield result
+                    if item != Event.SKIP and self._output:
+                        yield item
+                    continue
+                if is_chunk(item):
+                    self.batched = True
+                    for _ in item:
+                        self.window.append(_)
+                else:
+                    self.window.append(item)
+                if self.window.fulled:
+                    for result in self.flush(pool, self.workers * 2):
+                        yield result
+            for result in self.flush(pool, 0):
+                yield result
+            finished = True
+        finally:
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+
+    def flush(self, pool, limit):
+        if not self.window.empty:
+            self.counter += 1
+            callback = None if self.ordered else (lambda x, key=self.counter: self.done.put((key, x)))
+            self.pending.append((self.counter, pool.apply_async(_parallel_handle, (self.window.data, ),
+                                                                callback=callback)))
+
+        while self.pending:
+            if self.ordered:
+                if len(self.pending) <= limit and not self.pending[0][1].ready():
+                    break
+                success, result = self.pending.popleft()[1].get()
+            else:
+                if len(self.pending) <= limit and self.done.empty():
+                    break
+                try:
+                    key, (success, result) = self.done.get(timeout=1)
+                except Queue.Empty:
+                    for _, task in self.pending:
+                        if task.ready() and not task.successful():
+                            task.get()
+                    continue
+                for i, _ in enumerate(self.pending):
+                    if _[0] == key:
+                        del self.pending[i]
+                        break
+            if not success:
+                raise result
+            if not result:
+                continue
+            if self.batched and self._output:
+                yield Chunk(result)
+            else:
+                for _ in result:
+                    yield _
@@ -7,17 +7,72 @@ from utils import JSONCls
 __author__ = 'tong'
 
 
-class Expr(object):
+EQ = '{0} == {1}'
+NE = '{0} != {1}'
+LT = '{0} < {1}'
+GT = '{0} > {1}'
+LE = '{0} <= {1}'
+GE = '{0} >= {1}'
+CONTAIN = '{1} in {0}'
+IN = '{0} in {1}'
+
+
+def member(items):
+    values = frozenset(items)
+
+    def contains(value):
+        try:
+            return value in values
+        except TypeError:
+            return value in items
+    return contains
+
+
+class Compiler(object):
+    def __init__(self):
+        self.constants = {}
+        self.keys = False
+
+    def constant(self, value):
+        name = '_%s' % len(self.constants)
+        self.constants[name] = value
+        return name
+
+    def source(self, node):
+        if isinstance(node, (Expr, And, Or)):
+            return node.source(self)
+        return '%s(data)' % self.constant(node.result)
+
+    def compile(self, node):
+        source = self.source(node)
+        lines = ['def result(data%s):' % ''.join([', %s=%s' % (_, _) for _ in self.constants])]
+        if self.keys:
+            lines += ['    isdict = isinstance(data, dict)',
+                      '    get = data.get if isdict else None']
+        lines.append('    return %s' % source)
+        env = dict(self.constants)
+        exec compile('\n'.join(lines), '<pystream.logic>', 'exec') in env
+        return env['result']
+
+
+class Logic(object):
+    def compile(self):
+        return Compiler().compile(self)
+
+
+class Expr(Logic):
     def __init__(self, name=None):
         self.name = name or '_'
         self.operator = lambda x, y: x == y
         self.value = None
         self.linker = '='
+        self.code = EQ
 
-    def set(self, o, v, l):
+    def set(self, o, v, l, c=None):
         self.operator = o
         self.value = v
         self.linker = l
+        self.code = c
         return self
 
     def data(self, data):
@@ -26,29 +81,42 @@ class Expr(object):
     def result(self, data):
         return self.operator(self.data(data), self.value)
 
+    def variable(self, compiler):
+        return '%s(data)' % compiler.constant(self.data)
+
+    def source(self, compiler):
+        if not self.code:
+            return '%s(data)' % compiler.constant(self.result)
+        if self.code == IN and isinstance(self.value, (list, tuple, set)):
+            try:
+                return '%s(%s)' % (compiler.constant(member(self.value)), self.variable(compiler))
+            except TypeError:
+                pass
+        return '(%s)' % self.code.format(self.variable(compiler), compiler.constant(self.value))
+
     def __eq__(self, other):
-        return self.set(lambda x, y: x == y, other, '==')
+        return self.set(lambda x, y: x == y, other, '==', EQ)
 
     def __ne__(self, other):
-        return self.set(lambda x, y: x != y, other, '!=')
+        return self.set(lambda x, y: x != y, other, '!=', NE)
 
     def __lt__(self, other):
-        return self.set(lambda x, y: x < y, other, '<')
+        return self.set(lambda x, y: x < y, other, '<', LT)
 
     def __gt__(self, other):
-        return self.set(lambda x, y: x > y, other, '>')
+        return self.set(lambda x, y: x > y, other, '>', GT)
 
     def __le__(self, other):
-        return self.set(lambda x, y: x <= y, other, '<=')
+        return self.set(lambda x, y: x <= y, other, '<=', LE)
 
     def __ge__(self, other):
-        return self.set(lambda x, y: x >= y, other, '>=')
+        return self.set(lambda x, y: x >= y, other, '>=', GE)
 
     def contain(self, other):
-        return self.set(lambda x, y: y in x, other, 'in')
+        return self.set(lambda x, y: y in x, other, 'in', CONTAIN)
 
     def In(self, other):
-        return self.set(lambda x, y: x in y, other, 'in')
+        return self.set(lambda x, y: x in y, other, 'in', IN)
 
     def __or__(self, other):
         return Or(self, other)
@@ -64,6 +132,9 @@ class Text(Expr):
     def data(self, data):
         return data
 
+    def variable(self, compiler):
+        return 'data'
+
 
 class Key(Expr):
     def data(self, data):
@@ -71,24 +142,38 @@ class Key(Expr):
             raise Exception('data should be a dict')
         return data.get(self.name)
 
+    def variable(self, compiler):
+        compiler.keys = True
+        return '(get(%r) if isdict else %s(data))' % (self.name, compiler.constant(self.data))
 
-class And(object):
+
+class And(Logic):
     def __init__(self, *args):
         self.args = args
 
     def result(self, data):
-        return all([v.result(data) for v in self.args])
+        return all(v.result(data) for v in self.args)
+
+    def source(self, compiler):
+        if not self.args:
+            return 'True'
+        return '(%s)' % ' and '.join([compiler.source(v) for v in self.args])
 
     def __str__(self):
         return ' And '.join(['(%s)' % i for i in self.args])
 
 
-class Or(object):
+class Or(Logic):
     def __init__(self, *args):
         self.args = args
 
     def result(self, data):
-        return any([v.result(data) for v in self.args])
+        return any(v.result(data) for v in self.args)
+
+    def source(self, compiler):
+        if not self.args:
+            return 'False'
+        return '(%s)' % ' or '.join([compiler.source(v) for v in self.args])
 
     def __str__(self):
         return ' Or '.join(['(%s)' % i for i in self.args])
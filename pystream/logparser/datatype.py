@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import re
+from datetime import datetime
+from collections import OrderedDict
 from dateutil.parser import parse
 from exception import ParseException
 
@@ -17,6 +19,10 @@ class Datatype(object):
 
     __repr__ = __str__
 
+    @classmethod
+    def options(cls, option=None):
+        return ()
+
     @classmethod
     def get(cls, item):
         item = item.lower()
@@ -51,11 +57,94 @@ class Number(Datatype):
         return int(self._data)
 
 
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+          'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+
+def clf(text):
+    if len(text) != 20 or text[2] != '/' or text[6] != '/' or text[11] != ':' \
+            or text[14] != ':' or text[17] != ':':
+        raise ValueError(text)
+    return datetime(int(text[7:11]), MONTHS[text[3:6]], int(text[:2]),
+                    int(text[12:14]), int(text[15:17]), int(text[18:]))
+
+
+def isodate(text, separator='-'):
+    if len(text) != 10 or text[4] != separator or text[7] != separator:
+        raise ValueError(text)
+    return datetime(int(text[:4]), int(text[5:7]), int(text[8:]))
+
+
+def isotime(text, separator='-', delimiter=' '):
+    if len(text) != 19 or text[10] != delimiter or text[13] != ':' or text[16] != ':':
+        raise ValueError(text)
+    return isodate(text[:10], separator).replace(hour=int(text[11:13]), minute=int(text[14:16]),
+                                                 second=int(text[17:]))
+
+
+LAYOUTS = [
+    ('%d/%b/%Y:%H:%M:%S', clf),
+    ('%Y-%m-%d %H:%M:%S', isotime),
+    ('%Y-%m-%dT%H:%M:%S', lambda x: isotime(x, '-', 'T')),
+    ('%Y/%m/%d %H:%M:%S', lambda x: isotime(x, '/')),
+    ('%Y-%m-%d', isodate),
+]
+
+
+class DateParser(object):
+    def __init__(self, format=None, cachesize=4096):
+        self.format = format
+        self.fast = dict(LAYOUTS).get(format)
+        self.cache = OrderedDict()
+        self.cachesize = cachesize
+        self.last = None
+        self.value = None
+
+    def __call__(self, text):
+        if text == self.last:
+            return self.value
+        value = self.cache.pop(text, None)
+        if value is None:
+            value = self.parse(text)
+            if len(self.cache) >= self.cachesize:
+                self.cache.popitem(last=False)
+        self.cache[text] = value
+        self.last = text
+        self.value = value
+        return value
+
+    def parse(self, text):
+        if self.fast:
+            try:
+                return self.fast(text)
+            except (ValueError, KeyError):
+                pass
+        elif self.format:
+            try:
+                return datetime.strptime(text, self.format)
+            except ValueError:
+                pass
+        else:
+            for format, fast in LAYOUTS:
+                try:
+                    value = fast(text)
+                except (ValueError, KeyError):
+                    continue
+                self.format = format
+                self.fast = fast
+                return value
+        return parse(text, fuzzy=True)
+
+
 class Date(Datatype):
-    def __init__(self, data):
-        data = parse(data, fuzzy=True)
+    def __init__(self, data, parser=None):
+        data = (parser or DateParser())(data)
         super(Date, self).__init__(data)
 
+    @classmethod
+    def options(cls, option=None):
+        return DateParser(option),
+
     def __str__(self):
         return self._data.strftime('%Y-%m-%d %H:%M:%S')
 
@@ -49,7 +49,7 @@ class LogParser(object):
         keys = self._fields.keys()
         datatype = 'string'
         if self.rule.type == 'Type':
-            datatype = self.rule.rule.lower()
+            datatype = self.rule.rule.lower().partition(':')[0]
 
         ret = {}.fromkeys(keys, datatype)
         for name, parser in self._parser.items():
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pystream.executor.aggregator import Aggregator, Count, HyperLogLog
+
+__author__ = 'tong'
+
+
+class TestAggregator(unittest.TestCase):
+    def test_abstract(self):
+        self.assertRaises(TypeError, Aggregator)
+        self.assertEqual(Count()(range(5)), 5)
+
+
+class TestHyperLogLog(unittest.TestCase):
+    def test_sparse(self):
+        sparse, dense = HyperLogLog(), HyperLogLog(sparse=0)
+        for count in (10, 100, 1000, 10000):
+            self.assertEqual(sparse(range(count)), dense(range(count)))
+        self.assertTrue(isinstance(reduce(sparse.add, range(100), sparse.initial()), dict))
+        self.assertTrue(isinstance(reduce(sparse.add, range(1000), sparse.initial()), bytearray))
+
+    def test_merge(self):
+        hll = HyperLogLog()
+        small = reduce(hll.add, range(50), hll.initial())
+        large = reduce(hll.add, range(50, 5000), hll.initial())
+        expect = hll(range(5000))
+        self.assertEqual(hll.result(hll.merge(small, large)), expect)
+        self.assertEqual(hll.result(hll.merge(large, small)), expect)
+        self.assertEqual(hll.result(hll.merge(small, small)), hll(range(50)))
+
+
+if __name__ == '__main__':
+    unittest.main()
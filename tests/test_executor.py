@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import datetime
+import shutil
+import tempfile
+import unittest
+
+from pystream.config import rule
+from pystream.executor.source import Memory
+from pystream.executor.event import Event, Chunk
+from pystream.executor.executor import Parser, Map, Dedup, Sort, TopK, TopKbyKey, Combine, ReducebyKey, \
+    ReducebySortedKey, GroupbySortedKey, Windowed
+from pystream.executor.aggregator import Count
+from pystream.executor.utils import Tumbling
+from pystream.executor.join import DiskIndex, Lookup, Join
+
+__author__ = 'tong'
+
+
+class TestSort(unittest.TestCase):
+    def test_spill(self):
+        path = tempfile.mkdtemp()
+        try:
+            lines = ['127.0.0.%s - - [10/Oct/2017:13:55:%02d +0800] "GET /%s HTTP/1.1" 200 %s "-" "-"' % (i, 59 - i, i, i)
+                     for i in range(10)]
+            sort = Sort(key=lambda x: x['time_local'], maxsize=3, cache_path=path, emit='end', ignore_exc=False)
+            result = list(Memory(lines) | Parser(rule('nginx')) | sort)
+            self.assertEqual([_['remote_addr'] for _ in result], ['127.0.0.%s' % i for i in range(9, -1, -1)])
+            self.assertEqual(result[0], Parser(rule('nginx')).handle(lines[-1]))
+            self.assertEqual(os.listdir(path), [])
+        finally:
+            shutil.rmtree(path)
+
+    def test_lists(self):
+        result = list(Memory([[2, 'b'], [1, 'a'], [3, 'c']]) | Sort(maxsize=1, emit='end', ignore_exc=False))
+        self.assertEqual(result, [[1, 'a'], [2, 'b'], [3, 'c']])
+
+
+class TestTopK(unittest.TestCase):
+    def test_sorted(self):
+        random.seed(0)
+        items = [(random.randint(0, 20), i) for i in range(500)]
+        for desc in (False, True):
+            expect = sorted(items, key=lambda x: x[0], reverse=desc)
+            for k in (1, 10, 600):
+                result = list(Memory(items) | TopK(k, key=lambda x: x[0], desc=desc, emit='end'))
+                self.assertEqual(result, [expect[:k]])
+
+    def test_emit(self):
+        self.assertEqual(list(Memory([3, 1, 4, 1]) | TopK(2)), [[3], [1, 3], [1, 1]])
+        self.assertEqual(list(Memory([3, 1, Event.IDLE, 4, Event.IDLE, 2]) | TopK(2, emit='idle')),
+                         [[1, 3], [1, 2]])
+        self.assertEqual(list(Memory([]) | TopK(2, emit='end')), [])
+
+    def test_bykey(self):
+        items = [('x', 3), ('y', 1), ('x', 1), ('x', 2), ('y', 5)]
+        self.assertEqual(sorted(Memory(items) | TopKbyKey(2, emit='end')), [('x', [1, 2]), ('y', [1, 5])])
+        self.assertEqual(list(Memory(items) | TopKbyKey(1, desc=True)), [('x', [3]), ('y', [1]), ('y', [5])])
+
+
+class TestDedup(unittest.TestCase):
+    def test_dedup(self):
+        result = list(Memory(['a', 'b', 'a', u'c', 'c', 1, 1]) | Dedup(capacity=100, error_rate=0.001))
+        self.assertEqual(result, ['a', 'b', u'c', 1])
+
+    def test_cachefile(self):
+        path = tempfile.mkdtemp()
+        try:
+            cachefile = os.path.join(path, 'dedup')
+            self.assertEqual(list(Memory(['a', 'b', 'a']) | Dedup(cachefile=cachefile, capacity=100)), ['a', 'b'])
+            self.assertEqual(list(Memory(['b', 'c']) | Dedup(cachefile=cachefile, capacity=100)), ['c'])
+        finally:
+            shutil.rmtree(path)
+
+    def test_rotate(self):
+        items = [{'key': 'a', 'time': 0}, {'key': 'a', 'time': 50}, {'key': 'a', 'time': 150}, {'key': 'a', 'time': 260}]
+        dedup = Dedup(key=lambda x: x['key'], ttl=100, timestamp=lambda x: x['time'], capacity=100)
+        self.assertEqual([_['time'] for _ in Memory(items) | dedup], [0, 260])
+
+
+class TestCombine(unittest.TestCase):
+    def test_overflow(self):
+        items = [(_, 1) for _ in 'abacbad']
+        result = list(Memory(items) | Combine(lambda x, y: x + y, maxkeys=2))
+        totals = {}
+        for key, value in result:
+            totals[key] = totals.get(key, 0) + value
+        self.assertEqual(totals, {'a': 3, 'b': 2, 'c': 1, 'd': 1})
+        self.assertEqual(sum([_[1] for _ in result]), len(items))
+
+
+class TestReducebyKey(unittest.TestCase):
+    def test_every(self):
+        items = [(_, 1) for _ in 'aabab']
+        result = list(Memory(items) | ReducebyKey(lambda x, y: x + y, every=2))
+        self.assertEqual(sorted(result), [('a', 2), ('a', 3), ('b', 1), ('b', 2)])
+        self.assertRaises(Exception, ReducebyKey, lambda x, y: x + y, emit='item', every=2)
+
+    def test_spill(self):
+        path = tempfile.mkdtemp()
+        try:
+            items = [(_, [datetime.datetime(2017, 1, 1)]) for _ in 'abcabdca']
+            reduce = ReducebyKey(lambda x, y: x + y, maxkeys=2, cache_path=path, ignore_exc=False)
+            result = sorted(Memory(items) | reduce)
+            self.assertEqual(result, [(k, [datetime.datetime(2017, 1, 1)] * 'abcabdca'.count(k)) for k in 'abcd'])
+            self.assertEqual(os.listdir(path), [])
+        finally:
+            shutil.rmtree(path)
+
+
+class TestSortedKey(unittest.TestCase):
+    items = [('a', '1'), Chunk([('a', '2'), ('b', '3')]), Event.IDLE, (None, '4'), (None, '5'), ('a', '6')]
+
+    def test_reduce(self):
+        result = list(Memory(self.items) | ReducebySortedKey(lambda x, y: x + y, type=int))
+        self.assertEqual(result, [('a', 3), ('b', 3), (None, 9), ('a', 6)])
+        result = list(Memory([(_, 1) for _ in 'aab']) | ReducebySortedKey(Count()))
+        self.assertEqual(result, [('a', 2), ('b', 1)])
+        self.assertEqual(list(Memory([]) | ReducebySortedKey(lambda x, y: x + y)), [])
+
+    def test_group(self):
+        result = [(key, list(values)) for key, values in Memory(self.items) | GroupbySortedKey()]
+        self.assertEqual(result, [('a', ['1', '2']), ('b', ['3']), (None, ['4', '5']), ('a', ['6'])])
+        group = GroupbySortedKey(key=lambda x: x[0], value=lambda x: int(x[1]), aggregator=sum)
+        self.assertEqual(list(Memory(self.items) | group), [('a', 3), ('b', 3), (None, 9), ('a', 6)])
+        self.assertEqual(list(Memory(self.items) | GroupbySortedKey(key=lambda x: x[0], aggregator=Count())),
+                         [('a', 2), ('b', 1), (None, 2), ('a', 1)])
+
+
+class TestWindowed(unittest.TestCase):
+    def test_idle(self):
+        windowed = Windowed(Tumbling(10), timestamp=lambda x: x)
+        self.assertIsNone(windowed.handle(1))
+        self.assertIsNone(windowed.handle(5))
+        self.assertIsNone(windowed.handle_event(Event.IDLE))
+        windowed.arrival -= 6
+        self.assertEqual(windowed.handle_event(Event.IDLE), [((0, 10), [1, 5])])
+        self.assertIsNone(windowed.handle(8))
+        self.assertEqual(windowed.late, 1)
+        self.assertIsNone(windowed.handle(12))
+        self.assertEqual(windowed.fire(), [((10, 20), [12])])
+
+
+class TestLookup(unittest.TestCase):
+    def test_disk_keys(self):
+        path = tempfile.mkdtemp()
+        try:
+            items = [(u'b', 1), ('a', 2), (u'c', 3)]
+            for kwargs in ({}, {'path': path + '/index'}):
+                lookup = Lookup(lambda: [('a', 1), ('b', 2)], key=lambda x: x[0], how='left', **kwargs)
+                result = list(Memory(items) | lookup)
+                self.assertEqual([_[1] for _ in result], [('b', 2), ('a', 1), None])
+        finally:
+            shutil.rmtree(path)
+
+    def test_values(self):
+        path = tempfile.mkdtemp()
+        try:
+            table = [('a', [1, datetime.datetime(2017, 1, 1)]), ('b', None), ('c', (3, ))]
+            for kwargs in ({}, {'path': path + '/index'}):
+                lookup = Lookup(table, key=lambda x: x, value=lambda x: x[1])
+                self.assertEqual(list(Memory(['c', 'b', 'x', 'a']) | lookup),
+                                 [('c', (3, )), ('b', None), ('a', [1, datetime.datetime(2017, 1, 1)])])
+        finally:
+            shutil.rmtree(path)
+
+    def test_chunked_build(self):
+        path = tempfile.mkdtemp()
+        try:
+            items = [(i % 7, i) for i in range(50)]
+            index = DiskIndex(path + '/index', chunksize=4).build(items)
+            self.assertEqual([index.get(i) for i in range(8)], [49, 43, 44, 45, 46, 47, 48, None])
+            self.assertEqual(sorted(os.listdir(path)), ['index.data', 'index.index'])
+        finally:
+            shutil.rmtree(path)
+
+
+class TestJoin(unittest.TestCase):
+    def test_streams(self):
+        orders = Memory([{'id': 1, 'time': 0}, {'id': 2, 'time': 10}, {'id': 3, 'time': 20}, {'id': 4, 'time': 30}])
+        payments = Memory([{'id': 2, 'time': 12}, {'id': 1, 'time': 40}, {'id': 4, 'time': 31}, {'id': 5, 'time': 50}])
+        unmatched = []
+        join = Join(orders, payments, key=lambda x: x['id'], timestamp=lambda x: x['time'], within=5, lateness=10,
+                    unmatched=lambda side, item: unmatched.append((side, item['id'])))
+        result = list(join | Map(lambda x: (x[0]['id'], x[1]['time'] - x[0]['time'])))
+        self.assertEqual(result, [(2, 2), (4, 1)])
+        self.assertEqual(sorted(unmatched), [('left', 1), ('left', 3), ('right', 1), ('right', 5)])
+        self.assertEqual(join.status['matched'], 2)
+        self.assertRaises(Exception, lambda: Memory([]) | Join(Memory([]), Memory([]), key=None, timestamp=None))
+
+
+if __name__ == '__main__':
+    unittest.main()
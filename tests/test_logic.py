@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pystream.logic import Key, Text, And, Or
+
+__author__ = 'tong'
+
+DATA = [
+    {'a': 1, 'b': 'x', 'c': [1, 2]},
+    {'a': 5, 'b': 'yx', 'c': []},
+    {'a': None, 'b': None},
+    {},
+    'x',
+    'abc',
+    5,
+]
+
+
+def outcome(function, data):
+    try:
+        return function(data)
+    except Exception, e:
+        return e.__class__
+
+
+class TestCompile(unittest.TestCase):
+    def expressions(self):
+        return [
+            Key('a') == 1,
+            Key('a') != 1,
+            Key('a') > 2,
+            Key('a') <= 1,
+            Key('a').In([1, 2, 3]),
+            Key('c').In([[1, 2], [3]]),
+            Key('c').In([1, 2, 3]),
+            Key('b').contain('x'),
+            Text().In(['x', 'abc']),
+            Text().contain('b'),
+            And(Key('a') > 0, Key('b') == 'x'),
+            Or(Key('a') == 5, Key('b').contain('x')),
+            Or(Text() == 'x', Key('a') == 1),
+            And(Text() != 'x', Key('a') == 1),
+            And(),
+            Or(),
+        ]
+
+    def test_equivalent(self):
+        for expr in self.expressions():
+            compiled = expr.compile()
+            for data in DATA:
+                self.assertEqual(outcome(compiled, data), outcome(expr.result, data), '%s on %r' % (expr, data))
+
+    def test_unhashable(self):
+        match = Key('c').In([[1, 2], [3]]).compile()
+        self.assertTrue(match({'c': [1, 2]}))
+        self.assertFalse(match({'c': [2]}))
+        self.assertTrue(Key('c').In([1, 2]).compile()({'c': 2}))
+
+
+if __name__ == '__main__':
+    unittest.main()
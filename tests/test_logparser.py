@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pystream.config import rule
+from pystream.logparser.logparser import LogParser
+
+__author__ = 'tong'
+
+CORPUS = [
+    '127.0.0.1 - - [10/Oct/2017:13:55:36 +0800] "GET /index.html HTTP/1.1" 200 2326 '
+    '"http://example.com/" "Mozilla/5.0 (X11; Linux x86_64)"',
+    '192.168.1.20 - frank [01/Jan/2018:00:00:01 +0000] "POST /api/v1/items?id=3 HTTP/1.0" 201 0 "-" "curl/7.58.0"',
+    '10.0.0.2 - - [15/Mar/2018:08:12:00 +0800] "BREW /pot HTTP/1.1" 418 12 "-" "teapot"',
+    '8.8.8.8 - - [15/Mar/2018:08:12:00 +0800] "GET / HTTP/1.1" 304 - "-" "Wget"',
+    '255.255.255.255 - bob [29/Feb/2016:12:00:00 +0100] "DELETE /a%20b HTTP/2.0" 204 0 "https://x.org/p?q=1" "Opera/9.80"',
+    '198.35.46.20 - - [15/Feb/2017:13:11:03 +0800] "\\x05\\x01\\x00" 400 173 "-" "-"',
+    '127.0.0.1 - - [10/Oct/2017:13:55:36 +0800] "GET /q?s=\\"x\\" HTTP/1.1" 200 5 "-" "escaped"',
+    '127.0.0.1 - - [10/Oct/2017:13:55:36 +0800] "GET /nover" 200 5 "-" "-"',
+    '10.0.0.1 - - [31/Dec/2017:23:59:59 +0800] "-" 400 0 "-" "-"',
+    'garbage line',
+]
+
+# lines the `accesslog` type accepts on purpose while `nginx_regex` rejects them
+LENIENT = [
+    '::1 - - [10/Oct/2017:13:55:36 +0800] "GET / HTTP/1.1" 200 5 "-" "ipv6"',
+    '10.0.0.1 - - [31/Dec/2017:23:59:59 -0500] "GET / HTTP/1.1" 200 5 "-" "negative zone"',
+]
+
+
+def parse(parser, line):
+    try:
+        return parser.parse(line).result()
+    except Exception, e:
+        return e.__class__
+
+
+class TestAccesslog(unittest.TestCase):
+    def setUp(self):
+        self.accesslog = LogParser(rule('nginx'))
+        self.regex = LogParser(rule('nginx_regex'))
+
+    def test_conformance(self):
+        for line in CORPUS:
+            self.assertEqual(parse(self.accesslog, line), parse(self.regex, line), line)
+
+    def test_lenient(self):
+        for line in LENIENT:
+            self.assertIsInstance(parse(self.accesslog, line), dict, line)
+            self.assertNotIsInstance(parse(self.regex, line), dict, line)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+from pystream.executor.source import Memory
+from pystream.executor.middleware import Subscribe, Sensor
+
+__author__ = 'tong'
+
+
+def produce(address, items, batch):
+    (Memory(items) | Sensor(address, batch=batch)).start()
+
+
+def messages(count, topic='t'):
+    return [(topic, 'message %04d' % i) for i in range(count)]
+
+
+class TestSubscribe(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.servers = []
+        self.subscribe = self.start('sock')
+
+    def tearDown(self):
+        for subscribe, server in self.servers:
+            if server.is_alive():
+                self.stop(subscribe)
+            if server.is_alive():
+                server.terminate()
+        shutil.rmtree(self.path)
+
+    def start(self, name):
+        address = os.path.join(self.path, name)
+        subscribe = Subscribe(address=address, cache_path=os.path.join(self.path, 'data'),
+                              maxsize=1, archive_size=4096, partitions=2)
+        server = multiprocessing.Process(target=subscribe.start)
+        server.start()
+        self.servers.append((subscribe, server))
+        while not os.path.exists(address):
+            time.sleep(0.01)
+        return subscribe
+
+    def stop(self, subscribe):
+        for _, server in self.servers:
+            if _ is subscribe:
+                subscribe.stop()
+                server.join(5)
+
+    def produce(self, items, batch=50):
+        producer = multiprocessing.Process(target=produce, args=(self.subscribe.address, items, batch))
+        producer.start()
+        producer.join(30)
+        self.assertEqual(producer.exitcode, 0)
+
+    def consume(self, consumer, count):
+        result = []
+        iterator = iter(consumer)
+        for item in iterator:
+            result.append((consumer.partition, consumer.offset, item))
+            if len(result) >= count:
+                break
+        iterator.close()
+        return result
+
+    def test_segments(self):
+        self.produce(messages(1000))
+        status = self.subscribe.status('t')
+        self.assertEqual(status['partitions'], [{'start': 0, 'end': 500}, {'start': 0, 'end': 500}])
+        self.assertGreater(status['filenum'], 2)
+        expect = [(1, 400 + i, 'message %04d' % (801 + 2 * i)) for i in range(100)]
+        self.assertEqual(self.consume(self.subscribe['t', 1, 400], 100), expect)
+
+        self.stop(self.subscribe)
+        self.subscribe = self.start('restart')
+        self.assertEqual(self.subscribe.status('t'), status)
+        self.assertEqual(self.consume(self.subscribe['t', 1, 400], 100), expect)
+        self.assertEqual(self.consume(self.subscribe['t', 0], 3),
+                         [(0, 0, 'message 0000'), (0, 1, 'message 0002'), (0, 2, 'message 0004')])
+
+    def test_batches(self):
+        items = messages(2500) + [(u't', u'\u6d88\u606f %d' % i) for i in range(10)] + [('t', 'x' * 300000, 'y')]
+        self.produce(items, batch=1000)
+        result = self.consume(self.subscribe['t'], len(items))
+        expect = [_[1].encode('utf-8') if isinstance(_[1], unicode) else ','.join(_[1:]) for _ in items]
+        self.assertEqual([_[2] for _ in sorted(result, key=lambda x: (x[1], x[0]))], expect)
+        self.assertEqual(len(set([_[:2] for _ in result])), len(items))
+
+    def test_fanout(self):
+        self.produce(messages(500))
+        iterators = [iter(self.subscribe['t']) for _ in range(20)]
+        expect = sorted([_[1] for _ in messages(500)])
+        for iterator in iterators:
+            self.assertEqual(sorted([next(iterator) for _ in range(500)]), expect)
+        for iterator in iterators:
+            iterator.close()
+        subscribe, server = self.servers[0]
+        subscribe.stop()
+        server.join(2)
+        self.assertFalse(server.is_alive())
+
+    def wait(self, function, expect, timeout=5):
+        deadline = time.time() + timeout
+        while function() != expect and time.time() < deadline:
+            time.sleep(0.05)
+        return function()
+
+    def test_group(self):
+        self.produce(messages(100))
+        self.assertEqual(self.subscribe.lag('g'), {})
+        consumer = self.subscribe.consumer('t', group='g', interval=0)
+        iterator = iter(consumer)
+        first = [next(iterator) for _ in range(30)]
+        lag = lambda: self.subscribe.lag('g')['t']
+        self.assertEqual(self.wait(lambda: (lag()['members'], lag()['lag']), (1, 71)), (1, 71))
+        iterator.close()
+        self.assertEqual(self.wait(lambda: lag()['members'], 0), 0)
+        self.assertEqual([_['end'] for _ in lag()['partitions']], [50, 50])
+
+        second = [_[2] for _ in self.consume(self.subscribe.consumer('t', group='g', interval=0), 71)]
+        self.assertEqual(sorted(first[:29] + second), [_[1] for _ in messages(100)])
+        self.assertEqual(self.wait(lambda: lag()['lag'], 1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pystream.executor.event import is_event
+from pystream.executor.source import Tail, MultiTail, File, Csv
+
+__author__ = 'tong'
+
+
+def lines(iterator, count):
+    result = []
+    while len(result) < count:
+        item = next(iterator)
+        if not is_event(item):
+            result.append(item)
+    return result
+
+
+def append(filename, text):
+    with open(filename, 'a') as fp:
+        fp.write(text)
+
+
+class TestTail(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'access.log')
+        append(self.filename, 'a\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_rotate(self):
+        for notify in (True, False):
+            tail = Tail(self.filename, wait=0.1, notify=notify)
+            iterator = iter(tail)
+            self.assertEqual(lines(iterator, 1), ['a\n'])
+            os.rename(self.filename, self.filename + '.1')
+            append(self.filename, 'c\n')
+            self.assertTrue(is_event(next(iterator)))
+            append(self.filename + '.1', 'b\n')
+            self.assertEqual(lines(iterator, 2), ['b\n', 'c\n'])
+            iterator.close()
+            tail.stream.close()
+            os.rename(self.filename, self.filename + '.1')
+            append(self.filename, 'a\n')
+
+    def test_notifier_closed(self):
+        fds = len(os.listdir('/proc/self/fd'))
+        tail = Tail(self.filename, wait=0.1)
+        iterator = iter(tail)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+        self.assertEqual(lines(iterator, 1), ['a\n'])
+        iterator.close()
+        tail.stream.close()
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fds)
+
+    def test_checkpoint(self):
+        checkpoint = os.path.join(self.path, 'checkpoint')
+        append(self.filename, 'b\nc\nd\n')
+        tail = Tail(self.filename, wait=0.1, checkpoint=checkpoint, checkpoint_lines=2)
+        iterator = iter(tail)
+        self.assertEqual(lines(iterator, 3), ['a\n', 'b\n', 'c\n'])
+        iterator.close()
+        tail.stream.close()
+        tail = Tail(self.filename, wait=0.1, checkpoint=checkpoint, checkpoint_lines=2)
+        iterator = iter(tail)
+        self.assertEqual(lines(iterator, 2), ['c\n', 'd\n'])
+        self.assertEqual(tail.lineno, 4)
+        iterator.close()
+        tail.stream.close()
+
+
+class TestMultiTail(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.pattern = os.path.join(self.path, '*.log')
+        self.a = os.path.join(self.path, 'a.log')
+        self.b = os.path.join(self.path, 'b.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_discover(self):
+        for notify in (True, False):
+            append(self.a, 'a1\n')
+            iterator = iter(MultiTail(self.pattern, wait=0.1, scan=0.1, notify=notify))
+            self.assertEqual(lines(iterator, 1), [(self.a, 'a1\n')])
+            append(self.b, 'b1\n')
+            append(self.a, 'a2\n')
+            self.assertEqual(sorted(lines(iterator, 2)), [(self.a, 'a2\n'), (self.b, 'b1\n')])
+            os.remove(self.b)
+            append(self.a, 'a3\n')
+            self.assertEqual(lines(iterator, 1), [(self.a, 'a3\n')])
+            iterator.close()
+            os.remove(self.a)
+
+    def test_rotate(self):
+        for notify in (True, False):
+            append(self.a, 'a\n')
+            iterator = iter(MultiTail(self.pattern, wait=0.1, notify=notify))
+            self.assertEqual(lines(iterator, 1), [(self.a, 'a\n')])
+            os.rename(self.a, self.a + '.1')
+            append(self.a, 'c\n')
+            self.assertTrue(is_event(next(iterator)))
+            append(self.a + '.1', 'b\n')
+            self.assertEqual(lines(iterator, 2), [(self.a, 'b\n'), (self.a, 'c\n')])
+            iterator.close()
+            os.remove(self.a)
+
+
+class TestFile(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_offset(self):
+        filename = os.path.join(self.path, 'a.log')
+        append(filename, 'a\nbb\nccc\ndddd\ne')
+        source = File(filename, buffersize=4)
+        result = [(line, source.lineno, source.offset) for line in source]
+        self.assertEqual(result, [('a\n', 1, 2), ('bb\n', 2, 5), ('ccc\n', 3, 9), ('dddd\n', 4, 14)])
+
+    def test_checkpoint(self):
+        filename = os.path.join(self.path, 'a.log')
+        checkpoint = os.path.join(self.path, 'checkpoint')
+        append(filename, 'a\nb\nc\nd\ne\n')
+        iterator = iter(File(filename, checkpoint=checkpoint, checkpoint_lines=2, buffersize=4))
+        self.assertEqual([next(iterator) for _ in range(3)], ['a\n', 'b\n', 'c\n'])
+        iterator.close()
+        source = File(filename, checkpoint=checkpoint, checkpoint_lines=2)
+        self.assertEqual([(line, source.lineno) for line in source], [('c\n', 3), ('d\n', 4), ('e\n', 5)])
+        self.assertEqual(list(File(filename, checkpoint=checkpoint)), ['a\n', 'b\n', 'c\n', 'd\n', 'e\n'])
+
+    def test_csv_records(self):
+        filename = os.path.join(self.path, 'a.csv')
+        append(filename, '1,a\n2,"b\nc"\n3,"d\n\ne"\n4,f\n')
+        for confirmwait in (None, 0.01):
+            source = Csv(filename, confirmwait=confirmwait, buffersize=4)
+            result = [(line, source.lineno, source.offset) for line in source]
+            self.assertEqual(result, [(['1', 'a'], 1, 4), (['2', 'b\nc'], 2, 12),
+                                      (['3', 'd\n\ne'], 3, 21), (['4', 'f'], 4, 25)])
+
+
+if __name__ == '__main__':
+    unittest.main()
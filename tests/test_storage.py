@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from pystream.executor.storage import INDEX, Log, Segment, encode, decode
+
+__author__ = 'tong'
+
+
+class TestRecord(unittest.TestCase):
+    def test_decode(self):
+        data = encode(7, 'hello') + encode(8, '') + encode(9, 'world')
+        self.assertEqual(decode(data), ([(7, 'hello'), (8, ''), (9, 'world')], len(data)))
+        records, end = decode(data[:-1])
+        self.assertEqual(records, [(7, 'hello'), (8, '')])
+        self.assertEqual(decode(data, end), ([(9, 'world')], len(data)))
+        self.assertEqual(decode(''), ([], 0))
+
+
+class TestSegment(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_recover(self):
+        segment = Segment(self.path, 10, index_interval=32)
+        segment.append(['record %s' % _ for _ in range(10)], 10)
+        segment.close()
+        size = os.path.getsize(segment.filename)
+        with open(segment.filename, 'ab') as fp:
+            fp.write(encode(20, 'partial')[:-3])
+        segment = Segment(self.path, 10, index_interval=32)
+        self.assertEqual((segment.next, segment.size, os.path.getsize(segment.filename)), (20, size, size))
+        self.assertEqual(segment.append(['next'], segment.next), 21)
+
+    def test_stale_index(self):
+        segment = Segment(self.path, 0, index_interval=32)
+        segment.append(['record %s' % _ for _ in range(10)], 0)
+        segment.close()
+        with open(segment.filename, 'r+b') as fp:
+            fp.truncate(40)
+        with open(segment.indexname, 'ab') as fp:
+            fp.write(INDEX.pack(99, 100000))
+        segment = Segment(self.path, 0, index_interval=32)
+        self.assertEqual(os.path.getsize(segment.filename), segment.size)
+        self.assertTrue(segment.size <= 40)
+        self.assertTrue(all([_[1] < segment.size for _ in segment.index]))
+        self.assertEqual(os.path.getsize(segment.indexname), len(segment.index) * INDEX.size)
+        self.assertEqual(segment.lookup(segment.next), segment.size)
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_segments(self):
+        log = Log(self.path, segment_size=100, index_interval=16)
+        for i in range(10):
+            log.append(['%02d-%s' % (i, _) for _ in range(5)])
+        self.assertEqual((log.start, log.end), (0, 50))
+        self.assertTrue(len(log.segments) > 1)
+        segment, position = log.locate(23)
+        with open(segment.filename, 'rb') as fp:
+            fp.seek(position)
+            self.assertEqual(decode(fp.read())[0][0], (23, '04-3'))
+        log.close()
+        log = Log(self.path, segment_size=100, index_interval=16)
+        self.assertEqual((log.start, log.end), (0, 50))
+        log.close()
+
+    def test_retain(self):
+        log = Log(self.path, segment_size=100, retention_size=300)
+        for i in range(20):
+            log.append(['%02d-%s' % (i, _) for _ in range(5)])
+        self.assertTrue(log.size <= 300 + log.segments[-1].size)
+        self.assertTrue(log.start > 0)
+        self.assertEqual(log.end, 100)
+        log.retention_size = None
+        log.retention_time = 60
+        os.utime(log.segments[0].filename, (time.time() - 120, time.time() - 120))
+        start = log.segments[1].base
+        log.retain()
+        self.assertEqual(log.start, start)
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
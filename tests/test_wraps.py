@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pystream.executor.source import Memory
+from pystream.executor.executor import Map
+from pystream.executor.wraps import Parallel
+
+__author__ = 'tong'
+
+
+def square(x):
+    return x * x
+
+
+def fail(x):
+    if x == 77:
+        raise ValueError(x)
+    return x
+
+
+class TestParallel(unittest.TestCase):
+    def test_ordered(self):
+        result = list(Memory(range(1000)) | Parallel(Map(square), workers=2, chunksize=10))
+        self.assertEqual(result, [_ * _ for _ in range(1000)])
+
+    def test_unordered(self):
+        result = list(Memory(range(1000)) | Parallel(Map(square), workers=2, ordered=False, chunksize=10))
+        self.assertEqual(sorted(result), [_ * _ for _ in range(1000)])
+
+    def test_failure(self):
+        for ordered in (True, False):
+            parallel = Parallel(Map(fail, ignore_exc=False), workers=2, ordered=ordered, chunksize=10)
+            self.assertRaises(ValueError, list, Memory(range(1000)) | parallel)
+
+
+if __name__ == '__main__':
+    unittest.main()